@@ -0,0 +1,262 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import os
+import re
+import sqlite3
+import itertools
+import threading
+from datetime import date, datetime
+from dotenv import load_dotenv
+import mysql.connector
+from mysql.connector import errorcode
+
+
+load_dotenv()  # Load mysql credentials as environment variables
+
+# Dates are stored the way MySQL prints them, instead of relying on sqlite3's deprecated default adapters
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+
+
+class MySQLBackend:
+    """The MySQL server the schema and statements are written for, so they run as they are"""
+
+    name = 'mysql'
+    placeholder = '%s'
+    Error = mysql.connector.Error
+    databases = True  # The server holds named databases, which have to be created and selected
+    pooled = True  # Queries share connections checked out of a mysql.connector pool
+    load_data = True  # Tables can be written with LOAD DATA LOCAL INFILE
+    deferred_keys = True  # Foreign keys can be added to loaded tables with ALTER TABLE
+    fulltext = True  # Text columns can have FULLTEXT indexes, here with the ngram parser
+    use_pure = not mysql.connector.HAVE_CEXT  # The C extension parses the protocol with far less CPU per row
+
+    # Errors worth retrying: the server went away or dropped the connection, or a lock couldn't be had
+    transient_errors = {
+        errorcode.CR_SERVER_GONE_ERROR,
+        errorcode.CR_SERVER_LOST,
+        errorcode.CR_CONN_HOST_ERROR,
+        errorcode.ER_LOCK_DEADLOCK,
+        errorcode.ER_LOCK_WAIT_TIMEOUT,
+    }
+
+    def settings(self, database_name=None, **options):
+        """Keyword arguments of mysql.connector.connect for the configured server"""
+        config = {
+            'user': os.getenv('USERNAME'),
+            'password': os.getenv('PASSWORD'),
+            'host': os.getenv('HOST', '127.0.0.1'),
+            'port': int(os.getenv('PORT', 3306)),
+            'use_pure': self.use_pure,
+        }
+        if database_name:
+            config['database'] = database_name
+        config.update(options)
+        return config
+
+    def connect(self, database_name=None, autocommit=False, **options):
+        return mysql.connector.connect(**self.settings(database_name, autocommit=autocommit, **options))
+
+    def is_transient(self, err):
+        return isinstance(err, mysql.connector.Error) and err.errno in self.transient_errors
+
+    def begin_load(self, cursor):
+        pass
+
+    def end_load(self, cursor):
+        pass
+
+    def begin_snapshot(self, cursor):
+        """Starts a transaction every following read sees the same committed data in"""
+        cursor.execute("START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY;")
+
+    def table_statement(self, statement):
+        return statement
+
+
+class SQLiteBackend:
+    """An embedded SQLite database, in a file or in memory. Connections take the same MySQL statements
+    as the server: their cursors rewrite the DDL, placeholders, upserts and table renames SQLite spells differently.
+    Rows are written with executemany inside the load's single transaction."""
+
+    name = 'sqlite'
+    placeholder = '?'
+    Error = sqlite3.Error
+    databases = False
+    pooled = False  # Each thread reads through a connection of its own
+    load_data = False
+    deferred_keys = False  # SQLite can't add a foreign key to an existing table
+    fulltext = False
+
+    pragmas = ['PRAGMA foreign_keys = ON;', 'PRAGMA busy_timeout = 5000;', 'PRAGMA synchronous = NORMAL;']
+    # While loading, an interrupted load is simply loaded again, so nothing needs to reach the disk before the commit
+    load_pragmas = ['PRAGMA synchronous = OFF;', 'PRAGMA temp_store = MEMORY;', 'PRAGMA cache_size = -65536;']
+    _memory_names = itertools.count()
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.local = threading.local()
+        self.keeper = None
+        if path == ':memory:':
+            # Every connection opens the same named in-memory database, which lives while one of them is open
+            self.uri = f'file:starwars{next(self._memory_names)}?mode=memory&cache=shared'
+            self.keeper = self.connect()
+        else:
+            self.uri = None
+            connection = self.connect(autocommit=True)
+            connection.cursor().execute('PRAGMA journal_mode = WAL;')  # Readers don't block the loader, and it persists
+            connection.close()
+
+    def connect(self, database_name=None, autocommit=False, **options):
+        """Opens a connection. database_name and MySQL's options don't apply to a database file."""
+        if self.uri:
+            raw = sqlite3.connect(self.uri, uri=True, check_same_thread=False)
+        else:
+            raw = sqlite3.connect(self.path, check_same_thread=False)
+        raw.isolation_level = None if autocommit else ''  # '' opens a transaction before the first write
+        connection = SQLiteConnection(raw, self)
+        cursor = raw.cursor()
+        for pragma in self.pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+        return connection
+
+    def thread_connection(self):
+        """This thread's autocommit connection for reads, opened on first use"""
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = self.connect(autocommit=True)
+        return connection
+
+    def is_transient(self, err):
+        return isinstance(err, sqlite3.OperationalError) and 'locked' in str(err)
+
+    def begin_load(self, cursor):
+        for pragma in self.load_pragmas:
+            cursor.execute(pragma)
+
+    def end_load(self, cursor):
+        cursor.execute('PRAGMA synchronous = NORMAL;')
+        cursor.execute('PRAGMA optimize;')  # Gathers statistics for the tables the load filled
+
+    def begin_snapshot(self, cursor):
+        cursor.execute('BEGIN;')  # Reads in one transaction see the database as it was when it began
+
+    def table_statement(self, statement):
+        """A MySQL CREATE TABLE statement in SQLite's dialect"""
+        statement = re.sub(r'(\w+) \w+(?: UNSIGNED)? NOT NULL AUTO_INCREMENT PRIMARY KEY', r'\1 INTEGER PRIMARY KEY', statement)
+        statement = re.sub(r'(\w+) ENUM\(([^)]*)\)', r'\1 TEXT CHECK (\1 IN (\2))', statement)
+        return re.sub(r'\)\s*ROW_FORMAT=\w+(?: KEY_BLOCK_SIZE=\d+)?;$', ');', statement)
+
+    def translate(self, statement, has_parameters):
+        """The SQLite statements that do what a MySQL statement does, usually just the one"""
+        statement = statement.strip()
+        if has_parameters:  # Like the connector, %s is only a placeholder when there are parameters
+            statement = statement.replace('%s', '?')
+        if re.match(r'CREATE TABLE', statement, re.I):
+            return [self.table_statement(statement)]
+        match = re.match(r'RENAME TABLE (.*);$', statement, re.I | re.S)
+        if match:
+            return [f"ALTER TABLE {old} RENAME TO {new};"
+                    for old, new in (pair.strip().split(' TO ') for pair in match.group(1).split(','))]
+        match = re.match(r'DROP TABLE (IF EXISTS )?(.*);$', statement, re.I | re.S)
+        if match:
+            return [f"DROP TABLE {match.group(1) or ''}{table_name.strip()};" for table_name in match.group(2).split(',')]
+        match = re.search(r' ON DUPLICATE KEY UPDATE (.*);$', statement, re.I | re.S)
+        if match:
+            updates = re.sub(r'VALUES\((\w+)\)', r'excluded.\1', match.group(1))
+            return [statement[:match.start()] + f' ON CONFLICT DO UPDATE SET {updates};']
+        return [statement]
+
+
+class SQLiteConnection:
+    """A sqlite3 connection handing out SQLiteCursors, with the parts of mysql.connector's interface the scripts use"""
+
+    def __init__(self, raw, backend):
+        self.raw = raw
+        self.backend = backend
+
+    @property
+    def connection_id(self):
+        return id(self)
+
+    @property
+    def autocommit(self):
+        return self.raw.isolation_level is None
+
+    @autocommit.setter
+    def autocommit(self, value):
+        self.raw.isolation_level = None if value else ''
+
+    def cursor(self, prepared=False):
+        """sqlite3 already keeps the statements it has compiled, so prepared needs nothing more"""
+        return SQLiteCursor(self)
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        pass
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+
+class SQLiteCursor:
+    """A sqlite3 cursor that runs the MySQL statements the rest of the scripts are written in"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection.raw.cursor()
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def column_names(self):
+        return tuple(column[0] for column in self._cursor.description or ())
+
+    def execute(self, statement, parameters=None):
+        if re.fullmatch(r'\s*COMMIT\s*;?\s*', statement, re.I):
+            self.connection.commit()
+            return
+        statements = self.connection.backend.translate(statement, bool(parameters))
+        if len(statements) == 1:
+            self._cursor.execute(statements[0], tuple(parameters or ()))
+            return
+        self._cursor.execute('SAVEPOINT translated;')  # A RENAME of several tables stays atomic
+        for translated in statements:
+            self._cursor.execute(translated, tuple(parameters or ()))
+        self._cursor.execute('RELEASE translated;')
+
+    def executemany(self, statement, seq_parameters):
+        seq_parameters = [tuple(parameters) for parameters in seq_parameters]
+        translated, = self.connection.backend.translate(statement, True)
+        self._cursor.executemany(translated, seq_parameters)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchmany(self, size=1):
+        return self._cursor.fetchmany(size)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def close(self):
+        self._cursor.close()
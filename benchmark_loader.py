@@ -0,0 +1,233 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import statistics
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import db
+import create
+import insert
+import metrics
+import synthetic
+import swapi_server
+from registry import DimensionRegistry, dimension_tables
+
+
+def peak_rss_mb():
+    """The most memory this process has held at once"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10  # Bytes on macOS, kilobytes elsewhere
+
+
+def call_and_measure(function, *args):
+    return function(*args), peak_rss_mb()
+
+
+def in_fresh_process(function, *args):
+    """Runs function in a new interpreter, so its peak RSS isn't raised by whatever ran before it.
+    Returns its result and that peak."""
+    with ProcessPoolExecutor(1, multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(call_and_measure, function, *args).result()
+
+
+def timed_runs(run, repeat, setup=lambda: None):
+    """Calls run with what setup returns repeat times, timing only run.
+    Returns the rows it handled with its fastest and median seconds."""
+    seconds = []
+    for _ in range(repeat):
+        prepared = setup()
+        start = time.perf_counter()
+        rows = run(prepared)
+        seconds.append(time.perf_counter() - start)
+    return {'rows': rows, 'seconds': min(seconds), 'median_seconds': statistics.median(seconds),
+            'rows_per_second': rows / min(seconds) if min(seconds) else 0.0}
+
+
+def synthetic_pages(scale, seed=0):
+    """Entity table -> the API pages of its endpoint, generated at the scale"""
+    return {table_name: [data['results'] for _, data in synthetic.generate_pages(endpoint, scale, seed)]
+            for endpoint, table_name in insert.endpoint_tables.items()}
+
+
+def transform_all(pages):
+    """Converts every page into rows and relationship values, like the worker processes do"""
+    rows = 0
+    for table_name, table_pages in pages.items():
+        for page in table_pages:
+            rows += len(insert.transform_page(table_name, page)[0])
+    return rows
+
+
+def resolve_and_add(transformed, registry):
+    """Assigns lookup IDs and gathers relationships, like the loader does with what the workers return.
+    The batches are never flushed, so nothing touches a database."""
+    batches = {}
+    for table_name, results in transformed.items():
+        batch = batches[table_name] = insert.LoadBatch(None, registry, table_name, batch_size=float('inf'))
+        for rows, links in results:
+            for row, row_links in zip(batch.resolve(rows), links):
+                batch.add(row, row_links)
+    return batches
+
+
+def micro_benchmarks(scale, repeat):
+    """Times each part of transforming a synthetic API of the given scale into the rows insert.py writes"""
+    pages = synthetic_pages(scale)
+    transformed = {table_name: [insert.transform_page(table_name, page) for page in table_pages]
+                   for table_name, table_pages in pages.items()}
+    objects = sum(len(page) for table_pages in pages.values() for page in table_pages)
+    batches = resolve_and_add(transformed, DimensionRegistry())
+
+    def filled_registry():
+        registry = DimensionRegistry()
+        resolve_and_add(transformed, registry)
+        return registry
+
+    def resolve_all(registry):
+        resolve_and_add(transformed, registry)
+        return objects
+
+    def dimension_rows(registry):
+        return sum(len(registry.pending_rows(table_name)) for table_name in dimension_tables)
+
+    def relationship_rows(_):
+        return sum(len(list(insert.relationship_rows(relation_dict)))
+                   for batch in batches.values() for relation_dict in batch.relationships.values())
+
+    return {
+        'transform': timed_runs(lambda _: transform_all(pages), repeat),
+        'resolve and add': timed_runs(resolve_all, repeat, setup=DimensionRegistry),
+        'dimension rows': timed_runs(dimension_rows, repeat, setup=filled_registry),
+        'relationship rows': timed_runs(relationship_rows, repeat),
+    }
+
+
+def fresh_database(sqlite_path, defer_keys):
+    """Empty StarWars tables to load into: a new SQLite file, or the configured MySQL database dropped and recreated"""
+    if sqlite_path:
+        db.use_sqlite(sqlite_path)
+    cursor, connection = create.connectToMySQL()
+    if db.backend.databases:
+        cursor.execute(f"DROP DATABASE IF EXISTS {db.database};")
+        create.createDatabase(cursor, db.database)
+        cursor.execute(f"USE {db.database}")
+    create.create_tables(cursor, defer_keys)
+    cursor.close()
+    connection.close()
+
+
+def serve_synthetic(scale, connection):
+    """Serves a synthetic API on a free local port, sending back its url and object count.
+    It runs in a process of its own, so answering requests doesn't compete with the loader for the interpreter."""
+    server = swapi_server.SwapiServer(('127.0.0.1', 0), {})
+    server.objects = swapi_server.synthetic_objects(scale, base_url=server.base_url)
+    connection.send((server.base_url, sum(map(len, server.objects.values()))))
+    server.serve_forever()
+
+
+def load_benchmark(scale, loader_args, use_mysql):
+    """Loads a synthetic API served on a local port with insert.main(), timing the whole load"""
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    server = context.Process(target=serve_synthetic, args=(scale, sender), daemon=True)
+    server.start()
+    base_url, objects = receiver.recv()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            sqlite_path = None if use_mysql else os.path.join(directory, 'starwars.db')
+            create.compact = '--compact' in loader_args
+            fresh_database(sqlite_path, '--defer-keys' in loader_args)
+            argv = ['--no-cache', '--base-url', base_url] + loader_args + (['--sqlite', sqlite_path] if sqlite_path else [])
+            start = time.perf_counter()
+            insert.main(argv)
+            seconds = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.join()
+    rows = sum(stage['rows_written'] for stage in metrics.stages.values())
+    return {
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds,
+        'objects': objects,
+        **{counter: sum(stage[counter] for stage in metrics.stages.values())
+           for counter in ('fetch_wait_seconds', 'transform_seconds', 'database_seconds')},
+    }
+
+
+def compare(results, baseline, threshold):
+    """Prints each benchmark's rows/sec, and each load's peak RSS, against the baseline and returns the benchmarks
+    that got slower, or used more memory, than threshold allows"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            print(f"{name}\n    new benchmark, {result['rows_per_second']:,.0f} rows/s")
+            continue
+        slowdown = before['rows_per_second'] / result['rows_per_second'] if result['rows_per_second'] else float('inf')
+        growth = 1.0
+        report = f"{name}\n    {before['rows_per_second']:,.0f} -> {result['rows_per_second']:,.0f} rows/s ({slowdown:.2f}x slower)"
+        if 'peak_rss_mb' in result and before.get('peak_rss_mb'):
+            growth = result['peak_rss_mb'] / before['peak_rss_mb']
+            report += f", peak RSS {before['peak_rss_mb']:.1f} -> {result['peak_rss_mb']:.1f} MB ({growth:.2f}x)"
+        print(report)
+        if slowdown > threshold or growth > threshold:
+            regressions.append(name)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the transforms of insert.py and whole loads of a synthetic API')
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10, 100],
+                        help='sizes of the synthetic API the transforms are timed at, as multiples of the real one')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs of each microbenchmark, the fastest is kept')
+    parser.add_argument('--load-scales', type=float, nargs='*', default=[10],
+                        help='sizes of the synthetic API loaded end to end, none to skip the loads')
+    parser.add_argument('--loader-args', default='', help="options for insert.py's loads, e.g. '--processes 4'")
+    parser.add_argument('--mysql', action='store_true',
+                        help='load into the MySQL server in .env, dropping its StarWars database, instead of a new SQLite file')
+    parser.add_argument('--output', default='loader_benchmark.json', help='file the results are written to')
+    parser.add_argument('--baseline', help='earlier results to compare against')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help="rows/sec slowdown, or a load's peak RSS growth, against the baseline that counts as a regression")
+    args = parser.parse_args()
+
+    results = {}
+    for scale in args.scales:
+        # All of a scale's microbenchmarks share one interpreter, so its peak RSS isn't any one of theirs
+        benchmarks, _ = in_fresh_process(micro_benchmarks, scale, args.repeat)
+        for name, result in benchmarks.items():
+            results[f'{name} x{scale:g}'] = result
+            print(f"{result['rows_per_second']:14,.0f} rows/s  {result['seconds'] * 1000:9.2f} ms  {name} x{scale:g}")
+    for scale in args.load_scales:
+        result, peak = in_fresh_process(load_benchmark, scale, args.loader_args.split(), args.mysql)
+        results[f'load x{scale:g}'] = {**result, 'peak_rss_mb': peak}
+        print(f"{result['rows_per_second']:14,.0f} rows/s  {result['seconds']:9.2f} s   load x{scale:g}, peak RSS {peak:.1f} MB")
+
+    with open(args.output, 'w') as file:
+        json.dump({'environment': {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+                                   'loader_args': args.loader_args, 'backend': 'mysql' if args.mysql else 'sqlite'},
+                   'results': results}, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file)['results'], args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmarks regressed by more than {args.threshold}x")
+            exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import json
+import math
+import time
+import argparse
+import statistics
+import db
+from insert import connectToMySQL
+
+
+def parse_queries(path='queries.sql'):
+    """Splits a SQL file into (question, statement) pairs, where the question is the comment above the statement"""
+    queries = []
+    question = None
+    lines = []
+    with open(path) as file:
+        for line in file:
+            stripped = line.strip()
+            if stripped.startswith('--'):
+                question = stripped[2:].strip()
+            elif stripped.upper().startswith('USE ') or not stripped and not lines:
+                continue
+            else:
+                lines.append(line.rstrip())
+                if stripped.endswith(';'):
+                    queries.append((question, '\n'.join(lines).strip()))
+                    question = None
+                    lines = []
+
+    return queries
+
+
+def rows_examined(cursor):
+    """Rows the server examined for the previous statement on this connection, from the performance schema"""
+    if db.backend.name != 'mysql':
+        return None
+    try:
+        cursor.execute("SELECT ROWS_EXAMINED FROM performance_schema.events_statements_history " +
+                       "WHERE THREAD_ID = PS_CURRENT_THREAD_ID() ORDER BY EVENT_ID DESC LIMIT 1;")
+        row = cursor.fetchone()
+        return int(row[0]) if row else None
+    except db.backend.Error:
+        return None
+
+
+def explain(cursor, statement):
+    """Returns the JSON plan and, on servers that support it, the EXPLAIN ANALYZE output of a statement.
+    SQLite's plan is the rows of its EXPLAIN QUERY PLAN."""
+    if db.backend.name == 'sqlite':
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement)
+        return [list(row) for row in cursor.fetchall()], None
+    cursor.execute('EXPLAIN FORMAT=JSON ' + statement)
+    plan = json.loads(cursor.fetchone()[0])
+    try:
+        cursor.execute('EXPLAIN ANALYZE ' + statement)
+        analyze = '\n'.join(row[0] for row in cursor.fetchall())
+    except db.backend.Error:
+        analyze = None
+    return plan, analyze
+
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    return sorted_values[max(0, math.ceil(percent / 100 * len(sorted_values)) - 1)]
+
+
+def benchmark_query(cursor, statement, runs=20, warmup=3):
+    """Runs the statement warmup + runs times and returns its latency percentiles in milliseconds"""
+    for _ in range(warmup):
+        cursor.execute(statement)
+        cursor.fetchall()
+
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        cursor.execute(statement)
+        rows = cursor.fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    examined = rows_examined(cursor)
+
+    latencies.sort()
+    plan, analyze = explain(cursor, statement)
+    return {
+        'runs': runs,
+        'rows_returned': len(rows),
+        'rows_examined': examined,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'mean_ms': statistics.fmean(latencies),
+        'explain': plan,
+        'explain_analyze': analyze,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Prints each query's p50 and p95 against the baseline and returns the questions that got slower than threshold allows"""
+    regressions = []
+    for question, result in results.items():
+        before = baseline.get(question)
+        if not before:
+            print(f"{question}\n    new query, p50 {result['p50_ms']:.2f} ms")
+            continue
+        ratios = {key: result[key] / before[key] if before[key] else 1.0 for key in ('p50_ms', 'p95_ms')}
+        print(f"{question}\n    p50 {before['p50_ms']:.2f} -> {result['p50_ms']:.2f} ms ({ratios['p50_ms']:.2f}x), " +
+              f"p95 {before['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms ({ratios['p95_ms']:.2f}x)")
+        if ratios['p50_ms'] > threshold:
+            regressions.append(question)
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the statements in queries.sql')
+    parser.add_argument('--queries', default='queries.sql', help='SQL file to benchmark')
+    parser.add_argument('--runs', type=int, default=20, help='timed runs of each query')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed runs of each query before timing it')
+    parser.add_argument('--output', default='query_benchmark.json', help='file the results are written to')
+    parser.add_argument('--baseline', help='earlier results to compare against')
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help='p50 slowdown against the baseline that counts as a regression')
+    parser.add_argument('--sqlite', metavar='PATH', help='benchmark a SQLite database file instead of MySQL')
+    args = parser.parse_args()
+
+    if args.sqlite:
+        db.use_sqlite(args.sqlite)
+    cursor, connection = connectToMySQL()
+    results = {}
+    for question, statement in parse_queries(args.queries):
+        results[question] = {'sql': statement, **benchmark_query(cursor, statement, args.runs, args.warmup)}
+        print(f"{results[question]['p50_ms']:8.2f} ms p50  {results[question]['p99_ms']:8.2f} ms p99  {question}")
+    cursor.close()
+    connection.close()
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} queries regressed by more than {args.threshold}x")
+            exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+
+class ResponseCache:
+    """Stores API responses on disk, one JSON file per url.
+    A cache directory doubles as a snapshot that can be replayed without the network."""
+
+    def __init__(self, directory, ttl=86400, offline=False):
+        self.directory = directory
+        self.ttl = ttl  # Seconds an entry is used without asking the API if it changed
+        self.offline = offline
+        if not offline:
+            os.makedirs(directory, exist_ok=True)
+
+    def path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest() + '.json')
+
+    def get(self, url):
+        """Returns the cached entry for the url, or None when there isn't one"""
+        try:
+            with open(self.path(url)) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def is_fresh(self, entry):
+        return self.offline or time.time() - entry['fetched_at'] < self.ttl
+
+    def revalidation_headers(self, entry):
+        """Conditional request headers so the API can answer 304 Not Modified"""
+        headers = {}
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, url, data, headers=None):
+        headers = headers or {}
+        entry = {
+            'url': url,
+            'fetched_at': time.time(),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'data': data,
+        }
+        path = self.path(url)
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'  # Write then rename so readers never see half a file
+        with open(temp_path, 'w') as file:
+            json.dump(entry, file)
+        os.replace(temp_path, path)
+        return entry
+
+    def touch(self, url, entry):
+        """Marks an entry as fresh again after the API confirmed it hasn't changed"""
+        return self.put(url, entry['data'], {'ETag': entry.get('etag'), 'Last-Modified': entry.get('last_modified')})
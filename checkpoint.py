@@ -0,0 +1,44 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+from create import create_load_checkpoint_table
+
+
+enabled = False  # Commit every batch and record it, so a failed load can be resumed
+
+
+def create_checkpoint_table(cursor):
+    cursor.execute(create_load_checkpoint_table())
+
+
+def completed_stages(cursor):
+    cursor.execute("SELECT Stage FROM loadCheckpoint WHERE Complete = 1;")
+    return {stage for stage, in cursor.fetchall()}
+
+
+def committed_batches(cursor, stage):
+    """Returns how many batches of the stage were committed, 0 if it never got that far"""
+    cursor.execute("SELECT Batches FROM loadCheckpoint WHERE Stage = %s;", (stage,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def commit_batch(cursor, stage, batches):
+    """Records that the stage has written this many batches and commits them together with the record"""
+    cursor.execute("INSERT INTO loadCheckpoint (Stage, Batches, Complete) VALUES (%s, %s, 0) " +
+                   "ON DUPLICATE KEY UPDATE Batches = VALUES(Batches);", (stage, batches))
+    cursor.execute("COMMIT;")
+
+
+def complete_stage(cursor, stage):
+    cursor.execute("INSERT INTO loadCheckpoint (Stage, Batches, Complete) VALUES (%s, 0, 1) " +
+                   "ON DUPLICATE KEY UPDATE Complete = 1;", (stage,))
+    cursor.execute("COMMIT;")
+
+
+def clear(cursor):
+    """Forgets every checkpoint, once a load has finished or when a new one starts from scratch"""
+    cursor.execute("DELETE FROM loadCheckpoint;")
@@ -0,0 +1,258 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import os
+import re
+import json
+import argparse
+import numpy as np
+import create
+from registry import dimension_tables
+
+
+def table_columns(statement):
+    """(column, kind, numpy dtype) of every column a CREATE TABLE statement declares"""
+    columns = []
+    for column, sql_type, size in create.column_definitions(statement):
+        if sql_type in ('BOOLEAN', 'TINYINT', 'SMALLINT', 'MEDIUMINT', 'INT'):
+            columns.append((column, 'int', 'int32'))
+        elif sql_type == 'BIGINT':
+            columns.append((column, 'int', 'int64'))
+        elif sql_type == 'DECIMAL':
+            columns.append((column, 'float', 'float64'))
+        elif sql_type == 'DATE':
+            columns.append((column, 'date', 'datetime64[D]'))
+        else:
+            columns.append((column, 'str', str))  # As wide as the longest value rather than VARCHAR's limit
+    return columns
+
+
+def relationship_columns(statement):
+    """The two columns of a relationship table's composite primary key, None for any other table"""
+    match = re.search(r'PRIMARY KEY \((\w+), (\w+)\)', statement)
+    return match.groups() if match else None
+
+
+def column_array(values, kind, dtype):
+    """Converts a column's values to an array, with NULLs as NaN, NaT or '' and a mask for NULL integers"""
+    nulls = np.array([value is None for value in values], dtype=bool)
+    if kind == 'int':
+        return np.array([0 if value is None else value for value in values], dtype=dtype), nulls if nulls.any() else None
+    if kind == 'float':
+        return np.array([np.nan if value is None else float(value) for value in values], dtype=dtype), None
+    if kind == 'date':
+        return np.array([np.datetime64('NaT') if value is None else np.datetime64(value, 'D') for value in values],
+                        dtype=dtype), None
+    return np.array(['' if value is None else value for value in values], dtype=dtype), None
+
+
+def export_snapshot(cursor, directory):
+    """Writes every table of the schema as .npy files that load memory-mapped, plus a manifest.json describing them.
+    Lookup tables become dictionaries indexed by ID, so the ID columns referencing them are already their codes.
+    Relationship tables become (n, 2) int32 arrays sorted by their primary key."""
+    os.makedirs(directory, exist_ok=True)
+    manifest = {}
+    for statement in create.table_statements():
+        table_name = create.table_name_of(statement)
+        pair = relationship_columns(statement)
+        if pair:
+            cursor.execute(f"SELECT {pair[0]}, {pair[1]} FROM {table_name} ORDER BY {pair[0]}, {pair[1]};")
+            pairs = np.array(cursor.fetchall(), dtype='int32').reshape(-1, 2)
+            np.save(os.path.join(directory, f'{table_name}.npy'), pairs)
+            manifest[table_name] = {'kind': 'relationship', 'columns': list(pair), 'rows': len(pairs)}
+            continue
+
+        columns = table_columns(statement)
+        if table_name in dimension_tables:
+            value_column = dimension_tables[table_name]
+            cursor.execute(f"SELECT ID, {value_column} FROM {table_name};")
+            rows = cursor.fetchall()
+            values = [''] * (max((id_ for id_, _ in rows), default=0) + 1)  # ID 0 is never assigned
+            for id_, value in rows:
+                values[id_] = value or ''
+            np.save(os.path.join(directory, f'{table_name}.{value_column}.npy'), np.array(values, dtype=str))
+            manifest[table_name] = {'kind': 'dictionary', 'columns': [value_column], 'rows': len(rows)}
+            continue
+
+        names = [column for column, _, _ in columns]
+        order = ' ORDER BY ID' if 'ID' in names else ''
+        cursor.execute(f"SELECT {', '.join(names)} FROM {table_name}{order};")
+        rows = cursor.fetchall()
+        nullable = []
+        for index, (column, kind, dtype) in enumerate(columns):
+            array, nulls = column_array([row[index] for row in rows], kind, dtype)
+            np.save(os.path.join(directory, f'{table_name}.{column}.npy'), array)
+            if nulls is not None:
+                np.save(os.path.join(directory, f'{table_name}.{column}.null.npy'), nulls)
+                nullable.append(column)
+        manifest[table_name] = {'kind': 'entity', 'columns': names, 'nullable': nullable, 'rows': len(rows)}
+
+    with open(os.path.join(directory, 'manifest.json'), 'w') as file:
+        json.dump(manifest, file, indent=2)
+
+
+class ColumnarSnapshot:
+    """Answers the queries.sql workloads with vectorized operations over a snapshot written by export_snapshot.
+    Files are memory-mapped, so opening a snapshot is instant and processes share its pages."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'manifest.json')) as file:
+            self.manifest = json.load(file)
+        self.arrays = {}
+
+    def load(self, name):
+        if name not in self.arrays:
+            self.arrays[name] = np.load(os.path.join(self.directory, name + '.npy'), mmap_mode='r')
+        return self.arrays[name]
+
+    def column(self, table_name, column):
+        return self.load(f'{table_name}.{column}')
+
+    def valid(self, table_name, column):
+        """True where a column isn't NULL"""
+        if column in self.manifest[table_name].get('nullable', []):
+            return ~self.load(f'{table_name}.{column}.null')
+        return np.ones(self.manifest[table_name]['rows'], dtype=bool)
+
+    def pairs(self, table_name):
+        return self.load(table_name)
+
+    def decode(self, table_name, codes):
+        """Values of a lookup table for an array of its IDs"""
+        return self.column(table_name, dimension_tables[table_name])[codes]
+
+    def positions(self, table_name, ids):
+        """Row positions of the given IDs in an entity table, which is stored in ID order"""
+        return np.searchsorted(self.column(table_name, 'ID'), ids)
+
+    def lookup(self, table_name, column, ids):
+        return self.column(table_name, column)[self.positions(table_name, ids)]
+
+    def values(self, table_name, column, selection):
+        """A column's values at the selected rows as Python values, with None for NULL"""
+        values = self.column(table_name, column)[selection].tolist()
+        if column not in self.manifest[table_name].get('nullable', []):
+            return values
+        return [None if null else value for value, null in zip(values, self.load(f'{table_name}.{column}.null')[selection])]
+
+    def related(self, table_name, ids, from_column, to_column):
+        """IDs in to_column of the relationship's pairs whose from_column is one of ids, repeated once per pair"""
+        pairs = self.pairs(table_name)
+        columns = self.manifest[table_name]['columns']
+        from_index, to_index = columns.index(from_column), columns.index(to_column)
+        matches = pairs[np.isin(pairs[:, from_index], ids)]
+        return matches[:, from_index], matches[:, to_index]
+
+    def episode_films(self, episode_id):
+        return self.column('films', 'ID')[self.column('films', 'EpisodeID') == episode_id]
+
+    def characters_in_episode(self, episode_id):
+        """Names of the characters in an episode"""
+        _, person_ids = self.related('filmsPersons', self.episode_films(episode_id), 'filmsID', 'personID')
+        return [(name,) for name in sorted(self.lookup('person', 'Name', person_ids).tolist())]
+
+    def characters_per_film(self):
+        """(title, number of characters) of each film, from most to fewest characters"""
+        film_ids = self.pairs('filmsPersons')[:, self.manifest['filmsPersons']['columns'].index('filmsID')]
+        ids, counts = np.unique(film_ids, return_counts=True)
+        titles = self.lookup('films', 'Title', ids)
+        totals = {}
+        for title, amount in zip(titles.tolist(), counts.tolist()):  # Grouped by title, like queries.sql
+            totals[title] = totals.get(title, 0) + amount
+        return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+    def most_expensive_starship_per_species(self):
+        """(species, cost) of the most expensive starship flown by each species"""
+        pairs = self.pairs('starshipPerson')
+        columns = self.manifest['starshipPerson']['columns']
+        person_positions = self.positions('person', pairs[:, columns.index('personID')])
+        starship_positions = self.positions('starship', pairs[:, columns.index('starshipID')])
+        flown = self.valid('person', 'Species')[person_positions]
+        species = self.column('person', 'Species')[person_positions][flown]
+        costs = self.column('starship', 'Cost')[starship_positions][flown]
+        known = self.valid('starship', 'Cost')[starship_positions][flown]
+
+        maxima = dict.fromkeys(np.unique(species).tolist())  # MAX ignores NULLs, but every species still gets a row
+        species, costs = species[known], costs[known]
+        order = np.argsort(species, kind='stable')
+        species, costs = species[order], costs[order]
+        groups, starts = np.unique(species, return_index=True)
+        if len(groups):
+            maxima.update(zip(groups.tolist(), np.maximum.reduceat(costs, starts).tolist()))
+        names = self.lookup('species', 'Name', list(maxima)).tolist() if maxima else []
+        return sorted(zip(names, maxima.values()))
+
+    def homeworlds_in_episode(self, episode_id):
+        """(character, planet) of each character in an episode, by planet name"""
+        _, person_ids = self.related('filmsPersons', self.episode_films(episode_id), 'filmsID', 'personID')
+        positions = self.positions('person', person_ids)
+        has_homeworld = self.valid('person', 'Homeworld')[positions]
+        names = self.column('person', 'Name')[positions][has_homeworld]
+        planets = self.lookup('planet', 'Name', self.column('person', 'Homeworld')[positions][has_homeworld])
+        order = np.argsort(planets, kind='stable')
+        return list(zip(names[order].tolist(), planets[order].tolist()))
+
+    def vehicle_manufacturers_of(self, person_name):
+        """Manufacturers of the vehicles driven by a person"""
+        person_ids = self.column('person', 'ID')[self.column('person', 'Name') == person_name]
+        _, vehicle_ids = self.related('vehiclePerson', person_ids, 'personID', 'vehicleID')
+        _, manufacturer_ids = self.related('manufacturerVehicle', vehicle_ids, 'vehicleID', 'manufacturerID')
+        return [(name,) for name in self.decode('manufacturer', manufacturer_ids).tolist()]
+
+    def pilot_homeworld_climates_and_terrains(self, episode_id):
+        """(pilot, climate, terrain) of the homeworld of each starship pilot's species in an episode"""
+        _, starship_ids = self.related('filmsStarships', self.episode_films(episode_id), 'filmsID', 'starshipID')
+        _, person_ids = self.related('starshipPerson', np.unique(starship_ids), 'starshipID', 'personID')
+        positions = self.positions('person', np.unique(person_ids))
+        has_species = self.valid('person', 'Species')[positions]
+        pilots = self.column('person', 'Name')[positions][has_species]
+        species_positions = self.positions('species', self.column('person', 'Species')[positions][has_species])
+        has_homeworld = self.valid('species', 'Homeworld')[species_positions]
+        pilots = pilots[has_homeworld]
+        homeworlds = self.column('species', 'Homeworld')[species_positions][has_homeworld]
+
+        rows = set()
+        for pilot, planet in zip(pilots.tolist(), homeworlds.tolist()):
+            _, climates = self.related('planetClimate', [planet], 'planetID', 'climateID')
+            _, terrains = self.related('planetTerrain', [planet], 'planetID', 'terrainID')
+            for climate in self.decode('climate', climates).tolist():
+                rows.update((pilot, climate, terrain) for terrain in self.decode('terrain', terrains).tolist())
+        return sorted(rows)
+
+    def films_per_producer(self):
+        """(producer, number of films) of each producer"""
+        producer_ids = self.pairs('producerFilms')[:, self.manifest['producerFilms']['columns'].index('producerID')]
+        ids, counts = np.unique(producer_ids, return_counts=True)
+        return sorted(zip(self.decode('producer', ids).tolist(), counts.tolist()))
+
+    def people_with_surname(self, surname):
+        """(name, height, mass, eye color) of everyone whose name ends with the surname, like the Skywalkers"""
+        names = self.column('person', 'Name')
+        matches = np.char.endswith(np.char.lower(names), surname.lower()) & self.valid('person', 'EyeColor')
+        rows = zip(names[matches].tolist(),
+                   self.values('person', 'Height', matches),
+                   self.values('person', 'Mass', matches),
+                   self.decode('eyeColor', self.column('person', 'EyeColor')[matches]).tolist())
+        return sorted(rows, reverse=True)
+
+
+def main():
+    from insert import connectToMySQL
+
+    parser = argparse.ArgumentParser(description='Export the StarWars database as memory-mapped column files')
+    parser.add_argument('--output', default='columnar_snapshot', help='directory to write the column files to')
+    args = parser.parse_args()
+
+    cursor, connection = connectToMySQL()
+    export_snapshot(cursor, args.output)
+    cursor.close()
+    connection.close()
+    print(f"Wrote a columnar snapshot to {args.output}, open it with columnar.ColumnarSnapshot('{args.output}')")
+
+
+if __name__ == '__main__':
+    main()
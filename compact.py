@@ -0,0 +1,93 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import argparse
+import create
+from insert import connectToMySQL
+
+
+def storage_report(cursor):
+    """Returns a dict of table -> (data bytes, index bytes), with the statistics refreshed first"""
+    tables = [create.table_name_of(statement) for statement in create.default_table_statements()]
+    cursor.execute("SET SESSION information_schema_stats_expiry = 0;")  # Otherwise MySQL 8 serves cached sizes
+    cursor.execute(f"ANALYZE TABLE {', '.join(tables)};")
+    cursor.fetchall()
+    cursor.execute("SELECT TABLE_NAME, DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES " +
+                   "WHERE TABLE_SCHEMA = DATABASE();")
+    sizes = {table_name: (data, index) for table_name, data, index in cursor.fetchall()}
+    return {table_name: sizes[table_name] for table_name in tables if table_name in sizes}
+
+
+def print_report(before, after=None):
+    """Prints the data and index bytes of every table, side by side with after when it is given"""
+    def kib(size):
+        return f'{size / 1024:10.0f}'
+
+    if after is None:
+        print(f"{'table':24} {'data KiB':>10} {'index KiB':>10}")
+        for table_name, (data, index) in before.items():
+            print(f"{table_name:24} {kib(data)} {kib(index)}")
+        return
+
+    print(f"{'table':24} {'data KiB':>10} {'-> after':>10} {'index KiB':>10} {'-> after':>10}")
+    for table_name, (data, index) in before.items():
+        data_after, index_after = after.get(table_name, (0, 0))
+        print(f"{table_name:24} {kib(data)} {kib(data_after)} {kib(index)} {kib(index_after)}")
+    total_before = sum(data + index for data, index in before.values())
+    total_after = sum(data + index for data, index in after.values())
+    print(f"{'total':24} {kib(total_before)} {kib(total_after)}  ({total_after / total_before:.0%} of before)"
+          if total_before else f"{'total':24} {kib(total_before)} {kib(total_after)}")
+
+
+def fit_values(cursor):
+    """Rewrites the values the compact types can't hold: crew ranges keep their upper bound,
+    and anything else that isn't a count or one of an ENUM's values becomes NULL"""
+    for table_name in ('starship', 'vehicle'):
+        cursor.execute(f"UPDATE {table_name} SET Crew = TRIM(SUBSTRING_INDEX(Crew, '-', -1)) WHERE Crew LIKE '%-%';")
+        cursor.execute(f"UPDATE {table_name} SET Crew = NULL WHERE Crew NOT REGEXP '^[0-9]+$';")
+    for statement in create.default_table_statements():
+        table_name = create.table_name_of(statement)
+        for column, sql_type, values in create.column_definitions(create.compact_statement(statement)):
+            if sql_type == 'ENUM':
+                placeholders = ', '.join(['%s'] * len(values))
+                cursor.execute(f"UPDATE {table_name} SET {column} = NULL WHERE {column} NOT IN ({placeholders});", values)
+
+
+def drop_foreign_keys(cursor):
+    cursor.execute("SELECT TABLE_NAME, CONSTRAINT_NAME FROM information_schema.TABLE_CONSTRAINTS " +
+                   "WHERE TABLE_SCHEMA = DATABASE() AND CONSTRAINT_TYPE = 'FOREIGN KEY';")
+    for table_name, constraint_name in cursor.fetchall():
+        cursor.execute(f"ALTER TABLE {table_name} DROP FOREIGN KEY {constraint_name};")
+
+
+def migrate(cursor):
+    """Converts a database created with the default profile to the compact one, keeping its rows"""
+    fit_values(cursor)
+    drop_foreign_keys(cursor)
+    for statement in create.compact_migration_statements():
+        cursor.execute(statement)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate the StarWars database to the compact schema profile')
+    parser.add_argument('--report-only', action='store_true', help='only print the size of every table')
+    args = parser.parse_args()
+
+    cursor, connection = connectToMySQL()
+    before = storage_report(cursor)
+    if args.report_only:
+        print_report(before)
+    else:
+        migrate(cursor)
+        connection.commit()
+        print_report(before, storage_report(cursor))
+        print("Load into the migrated tables with: python insert.py --compact")
+    cursor.close()
+    connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import re
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+import create
+from registry import dimension_tables
+
+
+missing_values = {'unknown', 'n/a', 'indefinite', 'none'}  # How the API writes a value it doesn't know
+
+
+def text(value):
+    """The API's value lowercased, with None for a missing value. Values that aren't strings are kept as they are."""
+    if not isinstance(value, str):
+        return value
+    value = value.lower()
+    return None if not value or value in missing_values else value
+
+
+def number(value):
+    """A Decimal of the API's value with its thousands separators removed, None when it isn't a number.
+    A range like a starship's crew of '30-165' is its upper bound."""
+    value = text(value)
+    if not isinstance(value, str):
+        return value
+    value = value.replace(',', '')
+    value = re.sub(r'^[\d.]+\s*-\s*([\d.]+)$', r'\1', value)
+    try:
+        value = Decimal(value)
+    except InvalidOperation:
+        return None
+    return value if value.is_finite() else None
+
+
+def to_int(value):
+    value = number(value)
+    return int(Decimal(value).quantize(Decimal(1), ROUND_HALF_UP)) if value is not None else None  # MySQL rounds half up
+
+
+def to_decimal(value):
+    value = number(value)
+    return float(value) if value is not None else None
+
+
+def to_date(value):
+    value = text(value)
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+def varchar_converter(length):
+    def to_varchar(value):
+        value = text(value)
+        return str(value).replace(',', '')[:length] if value is not None else None
+    return to_varchar
+
+
+def enum_converter(values):
+    def to_enum(value):
+        value = text(value)
+        return value if value in values else None
+    return to_enum
+
+
+def url_id(url):
+    """The ID at the end of an API url, like 1 for https://swapi.dev/api/planets/1/"""
+    return int(url.rstrip('/').rsplit('/', 1)[-1])
+
+
+def url_id_converter(default=None):
+    def to_url_id(value):
+        if isinstance(value, list):  # A list of references, like a person's species, stores its first
+            value = value[0] if value else None
+        return url_id(value) if value else default
+    return to_url_id
+
+
+def dimension_converter(registry, table_name):
+    """Without a registry the value is kept as it is, for whoever holds the registry to look up"""
+    if registry is None:
+        return text
+
+    def to_dimension_id(value):
+        value = text(value)
+        return registry.get_id(table_name, value) if value is not None else None
+    return to_dimension_id
+
+
+type_converters = {
+    'BOOLEAN': to_int,
+    'TINYINT': to_int,
+    'SMALLINT': to_int,
+    'MEDIUMINT': to_int,
+    'INT': to_int,
+    'BIGINT': to_int,
+    'DECIMAL': to_decimal,
+    'DATE': to_date,
+}
+
+
+def column_converter(column, sql_type, size, reference, registry, default=None):
+    """Picks the converter of a column from its DDL: foreign keys to a lookup table go through the registry,
+    other foreign keys and the ID are read from API urls, everything else by its type"""
+    if reference in dimension_tables:
+        return dimension_converter(registry, reference)
+    if reference or column == 'ID':
+        return url_id_converter(default)
+    if sql_type == 'VARCHAR':
+        return varchar_converter(size)
+    if sql_type == 'TEXT':
+        return varchar_converter(65535)
+    if sql_type == 'ENUM':
+        return enum_converter(size)
+    return type_converters[sql_type]
+
+
+def dimension_columns(table_name, fields):
+    """(position, lookup table) of each column of the rows that is a foreign key to a lookup table"""
+    references = create.foreign_key_references(create.table_statement(table_name))
+    return [(position, references[column]) for position, column in enumerate(fields)
+            if references.get(column) in dimension_tables]
+
+
+def compile_converter(table_name, fields, registry, defaults=None):
+    """Builds a function that converts a page of API objects into rows of the table, one column at a time.
+    fields maps each column to the API field it is read from, in the order the rows list them."""
+    statement = create.table_statement(table_name)
+    definitions = {column: (sql_type, size) for column, sql_type, size in create.column_definitions(statement)}
+    references = create.foreign_key_references(statement)
+    defaults = defaults or {}
+    converters = [(field, column_converter(column, *definitions[column], references.get(column), registry, defaults.get(column)))
+                  for column, field in fields.items()]
+
+    def convert(objects):
+        columns = [list(map(converter, [object_[field] for object_ in objects])) for field, converter in converters]
+        return list(zip(*columns))
+
+    return convert
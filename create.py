@@ -4,14 +4,18 @@ Assignment: Final Project
 Author: Mark Morykan
 """
 
-import os
-from dotenv import load_dotenv
+import re
+import argparse
 import mysql.connector
+import db
+from registry import dimension_tables
+
+
+compact = False  # Create the tables with the compact profile's types and compressed rows
 
 
 def connectToMySQL():
-    load_dotenv()
-    cnx = mysql.connector.connect(password=os.getenv('PASSWORD'), user=os.getenv('USERNAME'))
+    cnx = db.connect(database_name=None, autocommit=True)  # The database doesn't exist yet, and DDL commits anyway
     cursor = cnx.cursor()
     return cursor, cnx
 
@@ -229,9 +233,30 @@ def create_producer_films_rship():
     return create_relationship('producerFilms', 'films', 'producer')
 
 
+def create_sync_watermark_table():  # Newest SWAPI 'edited' timestamp loaded for each entity table
+    return "CREATE TABLE IF NOT EXISTS syncWatermark " + \
+           "(TableName VARCHAR(30) NOT NULL PRIMARY KEY, " + \
+           "Edited VARCHAR(30) NOT NULL" + \
+           ");"
+
+
+def create_load_version_table():  # Bumped by every load, so cached query results know they are stale
+    return "CREATE TABLE IF NOT EXISTS loadVersion " + \
+           "(ID INT NOT NULL PRIMARY KEY, " + \
+           "Version BIGINT NOT NULL" + \
+           ");"
+
+
+def create_load_checkpoint_table():  # Batches each stage of a load has committed, for insert.py --resume
+    return "CREATE TABLE IF NOT EXISTS loadCheckpoint " + \
+           "(Stage VARCHAR(30) NOT NULL PRIMARY KEY, " + \
+           "Batches INT NOT NULL, " + \
+           "Complete BOOLEAN NOT NULL" + \
+           ");"
+
 
-def create_tables(cursor):
-    create_table_statements = [
+def default_table_statements():
+    return [
         create_planet_table(),
         create_climate_table(),
         create_terrain_table(),
@@ -271,18 +296,273 @@ def create_tables(cursor):
 
         create_producer_table(),
         create_producer_films_rship(),
+
+        create_sync_watermark_table(),
+        create_load_version_table(),
+        create_load_checkpoint_table(),
     ]
 
-    for statement in create_table_statements:
+
+def table_statements():
+    """CREATE TABLE statements of every table in the selected profile"""
+    statements = default_table_statements()
+    return [compact_statement(statement) for statement in statements] if compact else statements
+
+
+# ID types of the compact profile, big enough for ten thousand times the real API.
+# Synthetic lookup tables grow with the scale too, past SMALLINT's 65,535 values at about 3,450 times.
+compact_id_types = {
+    'planet': 'MEDIUMINT UNSIGNED',
+    'species': 'MEDIUMINT UNSIGNED',
+    'person': 'MEDIUMINT UNSIGNED',
+    'starship': 'MEDIUMINT UNSIGNED',
+    'vehicle': 'MEDIUMINT UNSIGNED',
+    'films': 'SMALLINT UNSIGNED',
+    **{table_name: 'MEDIUMINT UNSIGNED' for table_name in dimension_tables},
+}
+
+# Column types of the compact profile, IDs and foreign keys take the type of the ID they reference
+compact_column_types = {
+    'planet': {'RotationPeriod': 'SMALLINT UNSIGNED', 'OrbitalPeriod': 'SMALLINT UNSIGNED', 'Diameter': 'MEDIUMINT UNSIGNED',
+               'SurfaceWater': 'TINYINT UNSIGNED', 'Population': 'BIGINT UNSIGNED'},
+    'species': {'Designation': "ENUM('sentient','reptilian')", 'AverageHeight': 'SMALLINT UNSIGNED',
+                'AverageLifespan': 'SMALLINT UNSIGNED'},
+    'person': {'Height': 'SMALLINT UNSIGNED', 'Mass': 'SMALLINT UNSIGNED',
+               'Gender': "ENUM('male','female','hermaphrodite')"},
+    'starship': {'Cost': 'BIGINT UNSIGNED', 'Length': 'MEDIUMINT UNSIGNED', 'Crew': 'MEDIUMINT UNSIGNED',
+                 'Passengers': 'MEDIUMINT UNSIGNED', 'CargoCapacity': 'BIGINT UNSIGNED', 'MGLT': 'TINYINT UNSIGNED'},
+    'vehicle': {'Cost': 'BIGINT UNSIGNED', 'Length': 'MEDIUMINT UNSIGNED', 'Crew': 'MEDIUMINT UNSIGNED',
+                'Passengers': 'MEDIUMINT UNSIGNED', 'CargoCapacity': 'BIGINT UNSIGNED'},
+    'films': {'EpisodeID': 'SMALLINT UNSIGNED', 'OpeningCrawl': 'TEXT'},
+    **{table_name: {column: 'VARCHAR(100)'} for table_name, column in dimension_tables.items()},
+}
+
+compact_row_format = 'ROW_FORMAT=COMPRESSED KEY_BLOCK_SIZE=8'
+
+# Every column type either profile uses
+column_type_pattern = r"(?:TINY|SMALL|MEDIUM|BIG)?INT(?: UNSIGNED)?|BOOLEAN|DATE|TEXT|VARCHAR\(\d+\)|DECIMAL\(\d+, \d+\)|ENUM\([^)]*\)"
+
+
+def compact_type(table_name, column, references):
+    """The compact profile's type of a column, None when it keeps its type"""
+    if column == 'ID':
+        return compact_id_types.get(table_name)
+    if column in references:
+        return compact_id_types.get(references[column])
+    return compact_column_types.get(table_name, {}).get(column)
+
+
+def compact_statement(statement):
+    """Rewrites a CREATE TABLE statement of the default profile with the compact profile's types and row format"""
+    table_name = table_name_of(statement)
+    if table_name not in compact_id_types and not relationship_table(statement):
+        return statement
+    references = foreign_key_references(statement)
+
+    def retype(match):
+        new_type = compact_type(table_name, match.group(2), references)
+        return f'{match.group(1)}{match.group(2)} {new_type or match.group(3)}'
+
+    statement = re.sub(rf'([(,]\s*)(\w+) ({column_type_pattern})(?!\w)', retype, statement)
+    return statement[:-1] + f' {compact_row_format};'
+
+
+def relationship_table(statement):
+    return re.search(r'PRIMARY KEY \(\w+, \w+\)', statement) is not None
+
+
+def secondary_indexes():
+    """(table, index name, column) for the access paths queries.sql uses that no primary key covers"""
+    return [
+        ('films', 'filmsEpisodeID', 'EpisodeID'),  # Films are looked up by episode
+        ('person', 'personName', 'Name'),  # Characters are looked up by name
+        # A relationship's primary key only covers joining from its first column, these join from the second
+        ('filmsPersons', 'filmsPersonsFilmsID', 'filmsID'),
+        ('filmsStarships', 'filmsStarshipsFilmsID', 'filmsID'),
+        ('starshipPerson', 'starshipPersonStarshipID', 'starshipID'),
+        ('producerFilms', 'producerFilmsProducerID', 'producerID'),
+    ]
+
+
+def fulltext_indexes():
+    """(table, index name, column) of the text search.py searches. The ngram parser indexes every
+    two-character sequence, so a substring is found anywhere in a value rather than only at a word start."""
+    return [
+        ('person', 'personNameText', 'Name'),
+        ('planet', 'planetNameText', 'Name'),
+        ('species', 'speciesNameText', 'Name'),
+        ('starship', 'starshipNameText', 'Name'),
+        ('vehicle', 'vehicleNameText', 'Name'),
+        ('films', 'filmsOpeningCrawlText', 'OpeningCrawl'),
+    ]
+
+
+def create_fulltext_index(table_name, index_name, column):
+    return f"CREATE FULLTEXT INDEX {index_name} ON {table_name} ({column}) WITH PARSER ngram;"
+
+
+def summary_tables():
+    """(table, columns, query) of the aggregates rebuilt at the end of every load.
+    The first column is the primary key a dashboard looks a row up by, the query fills the columns in order."""
+    return [
+        ('filmCharacterCount',
+         "FilmID INT NOT NULL PRIMARY KEY, Title VARCHAR(30), NumberOfPeople INT",
+         "SELECT films.ID, films.Title, COUNT(*) FROM films " +
+         "INNER JOIN filmsPersons ON films.ID = filmsPersons.filmsID " +
+         "GROUP BY films.ID, films.Title"),
+        ('producerFilmCount',
+         "ProducerID INT NOT NULL PRIMARY KEY, Name VARCHAR(1024), Amount INT",
+         "SELECT producer.ID, producer.Name, COUNT(*) FROM producer " +
+         "INNER JOIN producerFilms ON producerFilms.producerID = producer.ID " +
+         "GROUP BY producer.ID, producer.Name"),
+        ('speciesMaxStarshipCost',
+         "SpeciesID INT NOT NULL PRIMARY KEY, Name VARCHAR(50), Cost BIGINT",
+         "SELECT species.ID, species.Name, MAX(starship.Cost) FROM species " +
+         "INNER JOIN person ON person.Species = species.ID " +
+         "INNER JOIN starshipPerson ON starshipPerson.personID = person.ID " +
+         "INNER JOIN starship ON starship.ID = starshipPerson.starshipID " +
+         "GROUP BY species.ID, species.Name"),
+    ]
+
+
+def create_summary_table(table_name, columns):
+    return f"CREATE TABLE IF NOT EXISTS {table_name} ({columns});"
+
+
+def refresh_summary_tables(cursor):
+    """Rebuilds every summary table next to the live one and swaps them in a single atomic RENAME,
+    so readers see either the old or the new aggregates and never an empty table"""
+    for table_name, columns, query in summary_tables():
+        cursor.execute(f"DROP TABLE IF EXISTS {table_name}New, {table_name}Old;")
+        cursor.execute(create_summary_table(table_name + 'New', columns))
+        cursor.execute(f"INSERT INTO {table_name}New {query};")
+        cursor.execute(create_summary_table(table_name, columns))
+        cursor.execute(f"RENAME TABLE {table_name} TO {table_name}Old, {table_name}New TO {table_name};")
+        cursor.execute(f"DROP TABLE {table_name}Old;")
+
+
+def foreign_key_clauses(statement):
+    return re.findall(r'FOREIGN KEY \(\w+\) REFERENCES \w+\(ID\) ON DELETE CASCADE', statement)
+
+
+def without_foreign_keys(statement):
+    """Strips the FOREIGN KEY clauses from a CREATE TABLE statement"""
+    return re.sub(r',\s*FOREIGN KEY \(\w+\) REFERENCES \w+\(ID\) ON DELETE CASCADE', '', statement)
+
+
+def table_name_of(statement):
+    return re.search(r'CREATE TABLE (?:IF NOT EXISTS )?(\w+)', statement).group(1)
+
+
+def table_statement(table_name):
+    return next(statement for statement in table_statements() if table_name_of(statement) == table_name)
+
+
+def column_definitions(statement):
+    """(column, type, size) of every column a CREATE TABLE statement declares, in order.
+    The size is VARCHAR's length, (precision, scale) for DECIMAL, the allowed values for ENUM and None otherwise."""
+    columns = []
+    for column, sql_type in re.findall(rf'[(,]\s*(\w+) ({column_type_pattern})', statement):
+        if sql_type.startswith('VARCHAR'):
+            columns.append((column, 'VARCHAR', int(re.search(r'\d+', sql_type).group())))
+        elif sql_type.startswith('DECIMAL'):
+            columns.append((column, 'DECIMAL', tuple(map(int, re.findall(r'\d+', sql_type)))))
+        elif sql_type.startswith('ENUM'):
+            columns.append((column, 'ENUM', tuple(re.findall(r"'([^']*)'", sql_type))))
+        else:
+            columns.append((column, sql_type.replace(' UNSIGNED', ''), None))
+    return columns
+
+
+def column_clauses(statement):
+    """Returns a dict of column -> its definition in a CREATE TABLE statement, leaving out PRIMARY KEY"""
+    return dict(re.findall(rf'[(,]\s*(\w+) ((?:{column_type_pattern})(?: NOT NULL)?(?: AUTO_INCREMENT)?)', statement))
+
+
+def foreign_key_references(statement):
+    """Returns a dict of column -> table its foreign key references"""
+    return dict(re.findall(r'FOREIGN KEY \((\w+)\) REFERENCES (\w+)\(ID\)', statement))
+
+
+def add_keys_and_indexes_statements():
+    """One ALTER TABLE per table adding all of its foreign keys and secondary indexes at once"""
+    additions = {}
+    for statement in table_statements():
+        clauses = ['ADD ' + clause for clause in foreign_key_clauses(statement)]
+        if clauses:
+            additions[table_name_of(statement)] = clauses
+    for table_name, index_name, column in secondary_indexes():
+        additions.setdefault(table_name, []).insert(0, f'ADD INDEX {index_name} ({column})')
+
+    return [f"ALTER TABLE {table_name} {', '.join(clauses)};" for table_name, clauses in additions.items()]
+
+
+def compact_migration_statements():
+    """ALTER TABLE statements converting the tables of the default profile to the compact one, in the order they run.
+    Each table is retyped and compressed, then the foreign keys are added back. They have to be dropped
+    beforehand, since a foreign key and the ID it references can't have different types even for a moment."""
+    retypes, foreign_keys = [], []
+    for statement in default_table_statements():
+        compacted = compact_statement(statement)
+        if compacted == statement:
+            continue
+        table_name = table_name_of(statement)
+        before, after = column_clauses(statement), column_clauses(compacted)
+        clauses = [f'MODIFY {column} {definition}' for column, definition in after.items() if definition != before[column]]
+        retypes.append(f"ALTER TABLE {table_name} {', '.join(clauses + [compact_row_format])};")
+        clauses = ['ADD ' + clause for clause in foreign_key_clauses(compacted)]
+        if clauses:
+            foreign_keys.append(f"ALTER TABLE {table_name} {', '.join(clauses)};")
+
+    return retypes + foreign_keys
+
+
+def create_tables(cursor, defer_keys=False):
+    """Creates every table and secondary index.
+    With defer_keys the tables are created bare, for add_keys_and_indexes to finish after the load."""
+    for statement in table_statements():
+        cursor.execute(without_foreign_keys(statement) if defer_keys else statement)
+    if not defer_keys:
+        for table_name, index_name, column in secondary_indexes():
+            cursor.execute(f"CREATE INDEX {index_name} ON {table_name} ({column});")
+        if db.backend.fulltext:
+            for table_name, index_name, column in fulltext_indexes():
+                cursor.execute(create_fulltext_index(table_name, index_name, column))
+    for table_name, columns, query in summary_tables():
+        cursor.execute(create_summary_table(table_name, columns))
+
+
+def add_keys_and_indexes(cursor):
+    """Adds the foreign keys and secondary indexes left out by create_tables(cursor, defer_keys=True).
+    Foreign key checks have to be on, so the loaded rows are validated while each table is rebuilt."""
+    for statement in add_keys_and_indexes_statements():
         cursor.execute(statement)
+    for table_name, index_name, column in fulltext_indexes():  # InnoDB builds one FULLTEXT index per statement
+        cursor.execute(create_fulltext_index(table_name, index_name, column))
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Create the StarWars database')
+    parser.add_argument('--defer-keys', action='store_true',
+                        help='create the tables without foreign keys or secondary indexes, for insert.py --defer-keys')
+    parser.add_argument('--compact', action='store_true',
+                        help='create the tables with right-sized types and compressed rows, for insert.py --compact')
+    parser.add_argument('--sqlite', metavar='PATH', help='create the tables in a SQLite database file instead of MySQL')
+    args = parser.parse_args()
+    if args.sqlite and args.defer_keys:
+        parser.error('SQLite cannot add foreign keys after a load, so --defer-keys needs MySQL')
+
+    global compact
+    compact = args.compact
+    if args.sqlite:
+        db.use_sqlite(args.sqlite)
     DB_NAME = 'StarWars'
     cursor, connection = connectToMySQL()
-    createDatabase(cursor, DB_NAME)
-    cursor.execute(f"USE {DB_NAME}")
-    create_tables(cursor)
+    if db.backend.databases:
+        createDatabase(cursor, DB_NAME)
+        cursor.execute(f"USE {DB_NAME}")
+    create_tables(cursor, args.defer_keys)
+    connection.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,160 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import os
+import time
+import threading
+from contextlib import contextmanager
+import mysql.connector
+from mysql.connector.pooling import MySQLConnectionPool
+import backends
+
+
+database = 'StarWars'
+backend = backends.MySQLBackend()  # Which database every connection opens, see use_sqlite
+pool_size = int(os.getenv('POOL_SIZE', 4))  # Connections kept open for pooled queries
+batch_size = int(os.getenv('BATCH_SIZE', 1000))  # Rows a loader holds in memory for a table before writing them
+attempts = 3  # Tries at connecting, or at a read that failed with a transient error
+retry_delay = 0.5  # Seconds before the first retry, doubling after every attempt
+version_check_interval = 1  # Seconds between checks of loadVersion, which insert.py bumps on every load
+
+_pool = None
+_pool_lock = threading.Lock()
+_prepared = {}  # (connection id, statement) -> cursor the statement is prepared on
+_prepared_lock = threading.Lock()
+
+
+def use_sqlite(path):
+    """Embeds the database in a SQLite file, or in memory for ':memory:', instead of connecting to MySQL.
+    Choosing the database already in use keeps it, so an in-memory one survives scripts closing their connections."""
+    global backend
+    if backend.name != 'sqlite' or backend.path != path:
+        close_pool()
+        backend = backends.SQLiteBackend(path)
+    return backend
+
+
+def is_transient(err):
+    return backend.is_transient(err)
+
+
+def retry(function, tries=None):
+    """Calls function until it doesn't fail with a transient error, backing off between attempts"""
+    tries = tries or attempts
+    for attempt in range(tries):
+        try:
+            return function()
+        except backend.Error as err:
+            if not is_transient(err) or attempt == tries - 1:
+                raise
+            time.sleep(retry_delay * 2 ** attempt)
+
+
+def connect(database_name=database, autocommit=False, **options):
+    """Opens a connection to the server, retrying while it is unreachable"""
+    return retry(lambda: backend.connect(database_name, autocommit=autocommit, **options))
+
+
+def get_pool():
+    """The shared pool, created on first use. Sessions aren't reset between checkouts,
+    since resetting one would deallocate the statements prepared on it."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = MySQLConnectionPool(pool_name='starwars', pool_size=pool_size, pool_reset_session=False,
+                                            **backend.settings(database, autocommit=True))
+    return _pool
+
+
+@contextmanager
+def pooled_connection():
+    """Checks a connection out of the pool, waiting for one to be free, and reconnects it if it was dropped.
+    Backends without a pool lend the thread its own connection."""
+    if not backend.pooled:
+        yield backend.thread_connection()
+        return
+    while True:
+        try:
+            connection = get_pool().get_connection()
+            break
+        except mysql.connector.PoolError:
+            time.sleep(0.001)
+    try:
+        connection.ping(reconnect=True, attempts=attempts, delay=retry_delay)
+        yield connection
+    finally:
+        connection.close()  # Returns it to the pool
+
+
+def prepared_cursor(connection, statement):
+    """The cursor a statement is prepared on for this connection, preparing it on first use"""
+    key = (connection.connection_id, statement)
+    with _prepared_lock:
+        cursor = _prepared.get(key)
+        if cursor is None:
+            cursor = _prepared[key] = connection.cursor(prepared=True)
+    return cursor
+
+
+def query(statement, params=()):
+    """Runs a read-only statement as a prepared statement on a pooled connection and returns every row.
+    Reads are safe to repeat, so transient errors are retried on a reconnected connection."""
+    def run():
+        with pooled_connection() as connection:
+            cursor = prepared_cursor(connection, statement)
+            cursor.execute(statement, params)
+            return [tuple(row) for row in cursor.fetchall()]
+
+    return retry(run)
+
+
+def load_version():
+    """The version insert.py bumps in loadVersion after every load, 0 before the first"""
+    rows = query("SELECT Version FROM loadVersion WHERE ID = 1;")
+    return rows[0][0] if rows else 0
+
+
+class Versioned:
+    """Something built from the database, like an in-memory graph or a result cache, rebuilt by calling build
+    once a load has been committed since it was built. loadVersion is checked at most once per
+    version_check_interval, so hot readers stay in memory. Readers keep the old value until the new one is built."""
+
+    def __init__(self, build):
+        self.build = build
+        self.value = None
+        self.version = None
+        self.checked_at = 0
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.value is not None and time.monotonic() - self.checked_at < version_check_interval:
+            return self.value
+        with self.lock:
+            if self.value is None or time.monotonic() - self.checked_at >= version_check_interval:
+                self.checked_at = time.monotonic()
+                version = load_version()
+                if self.value is None or version != self.version:
+                    self.value = self.build()
+                    self.version = version
+        return self.value
+
+    def refresh(self):
+        """Rebuilds the value now, whatever the version"""
+        with self.lock:
+            self.value = self.build()
+        return self.value
+
+
+def close_pool():
+    """Forgets the prepared statements and the pool, whose connections close as they are dropped"""
+    global _pool
+    with _prepared_lock:
+        for cursor in _prepared.values():
+            cursor.close()
+        _prepared.clear()
+    with _pool_lock:
+        _pool = None
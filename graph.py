@@ -0,0 +1,186 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import numpy as np
+import create
+import db
+from columnar import relationship_columns
+from registry import dimension_tables
+
+
+small_frontier = 64  # Fewer IDs than this are stepped with Python sets, which beat numpy's per-call overhead
+
+
+class Adjacency:
+    """Compressed sparse rows: the neighbours of ID i are indices[indptr[i]:indptr[i + 1]], sorted"""
+
+    def __init__(self, sources, targets):
+        order = np.lexsort((targets, sources))
+        self.indices = targets[order].astype('int32')
+        self.indptr = np.zeros(int(sources.max(initial=-1)) + 2, dtype='int64')
+        np.cumsum(np.bincount(sources, minlength=len(self.indptr) - 1), out=self.indptr[1:])
+        self.pointers, self.targets = self.indptr.tolist(), self.indices.tolist()  # For small frontiers
+
+    def row(self, id_):
+        """Neighbours of one ID"""
+        if not 0 <= id_ < len(self.indptr) - 1:
+            return self.indices[:0]
+        return self.indices[self.indptr[id_]:self.indptr[id_ + 1]]
+
+    def neighbours(self, ids):
+        """Distinct neighbours of the given IDs, sorted"""
+        if len(ids) < small_frontier:
+            pointers, targets, last = self.pointers, self.targets, len(self.pointers) - 1
+            found = set()
+            for id_ in ids.tolist() if isinstance(ids, np.ndarray) else ids:
+                if id_ < last:
+                    found.update(targets[pointers[id_]:pointers[id_ + 1]])
+            return np.fromiter(sorted(found), dtype='int64', count=len(found))
+        return np.unique(self.expand(ids)[1])
+
+    def expand(self, ids):
+        """(position in ids, neighbour) of every edge leaving the given IDs, in the order of ids"""
+        ids = np.asarray(ids, dtype='int64')
+        last = len(self.indptr) - 1
+        clipped = np.minimum(ids, last)  # IDs past the last one with edges have none, like the last one + 1
+        starts = self.indptr[clipped]
+        lengths = self.indptr[np.minimum(clipped + 1, last)] - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        return np.repeat(np.arange(len(ids)), lengths), self.indices[offsets]
+
+
+class Graph:
+    """Every relationship table and foreign key column, as adjacency in both directions between tables.
+    Two tables are linked by at most one relationship, so an edge is named by the tables it joins."""
+
+    def __init__(self):
+        self.edges = {}  # (from table, to table) -> Adjacency
+        self.labels = {}  # table -> names indexed by ID, like person -> Name and films -> Title
+        self.episodes = {}  # EpisodeID -> film IDs
+
+    def add_edge(self, from_table, to_table, pairs):
+        pairs = np.array(pairs, dtype='int64').reshape(-1, 2)
+        self.edges[(from_table, to_table)] = Adjacency(pairs[:, 0], pairs[:, 1])
+        self.edges[(to_table, from_table)] = Adjacency(pairs[:, 1], pairs[:, 0])
+
+    def add_labels(self, table_name, rows):
+        labels = np.empty(max((id_ for id_, _ in rows), default=0) + 1, dtype=object)
+        for id_, label in rows:
+            labels[id_] = label
+        self.labels[table_name] = labels
+
+    @classmethod
+    def load(cls, cursor):
+        """Reads the whole graph with one query per relationship table, foreign key column and named table"""
+        graph = cls()
+        for statement in create.default_table_statements():
+            table_name = create.table_name_of(statement)
+            references = create.foreign_key_references(statement)
+            pair = relationship_columns(statement)
+            if pair:
+                cursor.execute(f"SELECT {pair[0]}, {pair[1]} FROM {table_name};")
+                graph.add_edge(references[pair[0]], references[pair[1]], cursor.fetchall())
+                continue
+            for column, referenced in references.items():
+                cursor.execute(f"SELECT ID, {column} FROM {table_name} WHERE {column} IS NOT NULL;")
+                graph.add_edge(table_name, referenced, cursor.fetchall())
+
+            columns = [column for column, _, _ in create.column_definitions(statement)]
+            label = dimension_tables.get(table_name) or next((c for c in ('Name', 'Title') if c in columns), None)
+            if label and 'ID' in columns:
+                cursor.execute(f"SELECT ID, {label} FROM {table_name};")
+                graph.add_labels(table_name, cursor.fetchall())
+        cursor.execute("SELECT EpisodeID, ID FROM films;")
+        for episode_id, film_id in cursor.fetchall():
+            graph.episodes.setdefault(episode_id, []).append(film_id)
+        return graph
+
+    def edge(self, from_table, to_table):
+        try:
+            return self.edges[(from_table, to_table)]
+        except KeyError:
+            raise ValueError(f"No relationship between {from_table} and {to_table}") from None
+
+    def neighbours(self, from_table, to_table, ids):
+        """Distinct IDs of to_table linked to any of the given IDs of from_table"""
+        return self.edge(from_table, to_table).neighbours(ids)
+
+    def traverse(self, start_table, ids, path):
+        """Distinct IDs reached by following path, a list of tables, from the given IDs of start_table"""
+        for from_table, to_table in zip([start_table] + path, path):
+            ids = self.neighbours(from_table, to_table, ids)
+        return ids
+
+    def walks(self, start_table, ids, path):
+        """Every walk along path from the given IDs, as rows of the IDs it visits, one column per table.
+        Useful when a result needs something from along the way, like the pilot of a homeworld.
+        Walks are distinct without deduplicating, since no relationship holds the same pair twice."""
+        rows = np.unique(np.asarray(ids, dtype='int64')).reshape(-1, 1)
+        for from_table, to_table in zip([start_table] + path, path):
+            positions, targets = self.edge(from_table, to_table).expand(rows[:, -1])
+            rows = np.column_stack((rows[positions], targets))
+        return rows
+
+    def label(self, table_name, ids):
+        return self.labels[table_name][np.asarray(ids, dtype='int64')].tolist()
+
+    def episode_films(self, episode_id):
+        return self.episodes.get(episode_id, [])
+
+
+def load():
+    with db.pooled_connection() as connection:
+        cursor = connection.cursor()
+        graph = Graph.load(cursor)
+        cursor.close()
+    return graph
+
+
+_graph = db.Versioned(load)
+
+
+def refresh():
+    """Reloads the graph from the database. Readers keep the previous graph until the new one is swapped in."""
+    return _graph.refresh()
+
+
+def get_graph():
+    """The in-memory graph, reloaded once a load has been committed since it was read"""
+    return _graph.get()
+
+
+def related(start_table, ids, *path):
+    """Names of what is reached by following the tables of path from the given IDs,
+    e.g. related('films', [6], 'starship', 'person', 'species', 'planet', 'climate')"""
+    graph = get_graph()
+    return graph.label(path[-1], graph.traverse(start_table, ids, list(path)))
+
+
+def homeworld_climates_of_pilots(film_id):
+    """Climates of the homeworlds of the species of the pilots of the starships in a film"""
+    return related('films', [film_id], 'starship', 'person', 'species', 'planet', 'climate')
+
+
+def pilot_homeworld_climates_and_terrains(episode_id):
+    """(pilot, climate, terrain) of the homeworld of each starship pilot's species in an episode"""
+    graph = get_graph()
+    pilots = graph.traverse('films', graph.episode_films(episode_id), ['starship', 'person'])
+    planet_climates, planet_terrains = graph.edge('planet', 'climate'), graph.edge('planet', 'terrain')
+    rows = set()
+    for pilot in pilots.tolist():
+        name = graph.labels['person'][pilot]
+        for planet in graph.traverse('person', [pilot], ['species', 'planet']).tolist():
+            climates = graph.label('climate', planet_climates.row(planet))
+            terrains = graph.label('terrain', planet_terrains.row(planet))
+            rows.update((name, climate, terrain) for climate in climates for terrain in terrains)
+    return sorted(rows)
+
+
+def characters_in_episode(episode_id):
+    """Names of the characters in an episode"""
+    graph = get_graph()
+    person_ids = graph.edge('films', 'person').expand(graph.episode_films(episode_id))[1]  # One row per appearance
+    return [(name,) for name in sorted(graph.label('person', person_ids))]
@@ -4,423 +4,447 @@ Assignment: Final Project
 Author: Mark Morykan
 """
 
-import os
-from dotenv import load_dotenv
-import mysql.connector
-import requests
+import argparse
 from collections import defaultdict
-from datetime import datetime
-
-
-base_url = 'https://swapi.dev/api/'
-
-
-def connectToMySQL():
+from functools import partial
+import db
+import swapi
+from cache import ResponseCache
+from registry import DimensionRegistry, dimension_tables
+import writers
+from writers import write_rows, upsert_rows
+import sync
+import checkpoint
+import scheduler
+import create
+import converters
+import metrics
+import transform
+from converters import url_id
+from swapi import prefetch_pages
+
+
+def connectToMySQL(allow_local_infile=False, autocommit=False):
     """Connect to StarWars database"""
-    load_dotenv()  # Load mysql credentials as environment variables
-    try:
-        cnx = mysql.connector.connect(password=os.getenv('PASSWORD'), user=os.getenv('USERNAME'), database='StarWars')
-    except mysql.connector.Error as err:
-        print(f"Failed connecting to database: {err}")
-        exit(1)
-
-    cursor = cnx.cursor()
+    cnx = db.connect(allow_local_infile=allow_local_infile, autocommit=autocommit)
+    cursor = metrics.InstrumentedCursor(cnx.cursor())
     return cursor, cnx
 
 
-def get_response(endpoint):
-    """Get all the endpoint's data from the REST API by paginating through the API's results"""
-    response_list = []
-    url = base_url + endpoint
-    response = requests.get(url)
-    data = response.json()
-    response_list += data['results']
-    while data['next']:
-        response = requests.get(data['next'])
-        data = response.json()
-        response_list += data['results']
+def insert_into_two_column_entity(cursor, registry, table_name):
+    """Inserts the registry's new values into a basic two column entity, where the first column is the id column"""
+    write_rows(cursor, table_name, ['ID', dimension_tables[table_name]], registry.pending_rows(table_name))
 
-    return response_list
 
+def insert_into_dimensions(cursor, registry):
+    """Writes every lookup value the registry handed out since the last call.
+    The registry's own autocommit cursor is used when there is one, so other connections see the values right away."""
+    with registry.lock:
+        for table_name in dimension_tables:
+            insert_into_two_column_entity(registry.cursor or cursor, registry, table_name)
 
-def convert_into_two_column_entity(cursor, table_name, column_name, collection_of_values, do_insertion=True):
-    """Inserts into a basic two column entity, where the first column is the id column"""
-    relation_dict = {}
-    values = []
-    sql = f"INSERT INTO {table_name} ({column_name}) VALUES (%s);"
-    for id_, type_ in enumerate(collection_of_values, 1):
-        values.append([type_])
-        relation_dict[id_] = collection_of_values[type_]
 
-    if do_insertion:
-        cursor.executemany(sql, values)
-
-    return relation_dict
+def relationship_rows(dict_of_relationship):
+    """The rows of a many-to-many relationship, from a dict of each ID to the IDs it is related to"""
+    return ((foreign2_id, foreign1_id) for foreign1_id in dict_of_relationship for foreign2_id in dict_of_relationship[foreign1_id])
 
 
 def insert_into_relationship(cursor, table_name, dict_of_relationship):
     """Insert data into a many-to-many relationship"""
-    sql = f"INSERT INTO {table_name} VALUES (%s, %s);"
-    sub_arguments = [(foreign2_id, foreign1_id) for foreign1_id in dict_of_relationship for foreign2_id in dict_of_relationship[foreign1_id]]
-
-    cursor.executemany(sql, sub_arguments)
-
-
-def get_info(object_, desired_columns):
-    """Returns a list of info from the API response object to be stored in the database"""
-    info = []
-    url = object_['url']
-    id_ = int(url.split('/')[-2])
-    info.append(id_)
-    for column in desired_columns:
-        value = object_[column]
-        if value: 
-            value = value.lower()
-            if value != 'unknown' and value != 'n/a' and value != 'indefinite' and value != 'none':
-                value = value.replace(',', '')
-                info.append(value if not value.isdigit() else int(value))
+    write_rows(cursor, table_name, None, relationship_rows(dict_of_relationship))
+
+
+# API field each column of an entity table is read from, in the order the columns are written.
+# How a field is converted follows from the column's definition in create.py.
+api_fields = {
+    'planet': {'ID': 'url', 'Name': 'name', 'RotationPeriod': 'rotation_period', 'OrbitalPeriod': 'orbital_period',
+               'Diameter': 'diameter', 'Gravity': 'gravity', 'SurfaceWater': 'surface_water', 'Population': 'population'},
+    'species': {'ID': 'url', 'Name': 'name', 'Classification': 'classification', 'Designation': 'designation',
+                'AverageHeight': 'average_height', 'AverageLifespan': 'average_lifespan', 'Homeworld': 'homeworld',
+                'Language': 'language'},
+    'person': {'ID': 'url', 'Name': 'name', 'Height': 'height', 'Mass': 'mass', 'EyeColor': 'eye_color',
+               'BirthYear': 'birth_year', 'Gender': 'gender', 'Homeworld': 'homeworld', 'Species': 'species'},
+    'starship': {'ID': 'url', 'Name': 'name', 'Model': 'model', 'Cost': 'cost_in_credits', 'Length': 'length',
+                 'MaxSpeed': 'max_atmosphering_speed', 'Crew': 'crew', 'Passengers': 'passengers',
+                 'CargoCapacity': 'cargo_capacity', 'Consumables': 'consumables', 'HyperdriveRating': 'hyperdrive_rating',
+                 'MGLT': 'MGLT', 'Class': 'starship_class'},
+    'vehicle': {'ID': 'url', 'Name': 'name', 'Model': 'model', 'Cost': 'cost_in_credits', 'Length': 'length',
+                'MaxSpeed': 'max_atmosphering_speed', 'Crew': 'crew', 'Passengers': 'passengers',
+                'CargoCapacity': 'cargo_capacity', 'Consumables': 'consumables', 'Class': 'vehicle_class'},
+    'films': {'ID': 'url', 'EpisodeID': 'episode_id', 'Title': 'title', 'OpeningCrawl': 'opening_crawl',
+              'Director': 'director', 'ReleaseDate': 'release_date'},
+}
+
+# Values of columns the API leaves empty
+column_defaults = {
+    'person': {'Species': 1},  # Human species isn't attached to characters in the API
+}
+
+# Relationship tables filled alongside each entity table, in the order their values are read from an object
+relationship_tables = {
+    'planet': ['planetClimate', 'planetTerrain'],
+    'species': ['speciesHairColor', 'speciesEyeColor', 'speciesSkinColor'],
+    'person': ['personHairColor', 'personSkinColor'],
+    'starship': ['starshipPerson', 'manufacturerStarship'],
+    'vehicle': ['vehiclePerson', 'manufacturerVehicle'],
+    'films': ['filmsPersons', 'filmsSpecies', 'filmsPlanets', 'filmsStarships', 'filmsVehicles', 'producerFilms'],
+}
+
+# API field each relationship table is read from, and the lookup table its values are kept in.
+# Lookup values come in one string, like 'arid, temperate'. Without a lookup table the field is a list of urls.
+relationship_fields = {
+    'planetClimate': ('climate', 'climate'),
+    'planetTerrain': ('terrain', 'terrain'),
+    'speciesHairColor': ('hair_colors', 'hairColor'),
+    'speciesEyeColor': ('eye_colors', 'eyeColor'),
+    'speciesSkinColor': ('skin_colors', 'skinColor'),
+    'personHairColor': ('hair_color', 'hairColor'),
+    'personSkinColor': ('skin_color', 'skinColor'),
+    'starshipPerson': ('pilots', None),
+    'manufacturerStarship': ('manufacturer', 'manufacturer'),
+    'vehiclePerson': ('pilots', None),
+    'manufacturerVehicle': ('manufacturer', 'manufacturer'),
+    'filmsPersons': ('characters', None),
+    'filmsSpecies': ('species', None),
+    'filmsPlanets': ('planets', None),
+    'filmsStarships': ('starships', None),
+    'filmsVehicles': ('vehicles', None),
+    'producerFilms': ('producer', 'producer'),
+}
+
+# Relationship table -> (owner ids, relationship dict) held back until the entity tables it references are loaded
+deferred_relationships = {}
+
+
+def relationship_values(object_, field, lookup_table):
+    """The IDs of the urls an object lists in field, or the distinct lookup values of its string"""
+    if lookup_table is None:
+        return list(map(url_id, object_[field]))
+    if object_[field] == 'unknown':
+        return []
+    return list(dict.fromkeys(object_[field].split(', ')))  # A value listed twice is one relationship
+
+
+_converters = {}  # (table, compact) -> converter compiled by this process
+
+
+def transform_page(table_name, page):
+    """Converts a page of API objects into rows and each object's relationship values, in any process.
+    The registry stays with the loader, so the rows' lookup columns still hold their values."""
+    key = (table_name, create.compact)
+    if key not in _converters:
+        _converters[key] = converters.compile_converter(table_name, api_fields[table_name], None,
+                                                        column_defaults.get(table_name))
+    links = [[relationship_values(object_, *relationship_fields[name]) for name in relationship_tables[table_name]]
+             for object_ in page]
+    return _converters[key](page), links
+
+
+class LoadBatch:
+    """Rows of an entity table together with the relationships found alongside them.
+    Flushing writes new lookup values, then the rows, then the relationships, so every foreign key already exists."""
+
+    def __init__(self, cursor, registry, table_name, batch_size=None):
+        self.cursor = cursor
+        self.registry = registry
+        self.table_name = table_name
+        self.columns = list(api_fields[table_name])
+        self.dimension_columns = converters.dimension_columns(table_name, self.columns)
+        self.relationship_tables = relationship_tables[table_name]
+        self.lookup_tables = [relationship_fields[name][1] for name in self.relationship_tables]
+        self.batch_size = batch_size or writers.batch_size
+        self.watermark = sync.get_watermark(cursor, table_name) if sync.enabled else None
+        self.edited = self.watermark or ''  # Newest 'edited' timestamp seen
+        self.batches = 0  # Batches flushed so far
+        self.committed_batches = checkpoint.committed_batches(cursor, table_name) if checkpoint.enabled else 0
+        self.reset()
+
+    def edited_pages(self, pages):
+        """Skips the objects that haven't been edited since the last sync"""
+        for page in metrics.waited(pages):
+            if self.watermark:
+                page = [object_ for object_ in page if object_['edited'] > self.watermark]  # ISO 8601 sorts in time order
+            if page:
+                self.edited = max(self.edited, max(object_['edited'] for object_ in page))
+                yield page
+
+    def pages(self, pages):
+        """Yields each page as (row, relationship values) pairs. A whole page is transformed at once,
+        on worker processes once the endpoint is large enough. Lookup IDs are only handed out here,
+        in page order, so they are the same however many processes transformed the pages."""
+        for rows, links in transform.map_pages(transform_page, self.table_name, self.edited_pages(pages)):
+            with metrics.timed('transform_seconds'):
+                rows = self.resolve(rows)
+            yield zip(rows, links)
+
+    def resolve(self, rows):
+        """Replaces the values in the lookup columns of the rows with their registry IDs, a column at a time"""
+        if not self.dimension_columns:
+            return rows
+        rows = [list(row) for row in rows]
+        for position, table_name in self.dimension_columns:
+            for row in rows:
+                if row[position] is not None:
+                    row[position] = self.registry.get_id(table_name, row[position])
+        return [tuple(row) for row in rows]
+
+    def reset(self):
+        self.rows = []
+        self.relationships = {table: defaultdict(list) for table in self.relationship_tables}
+
+    def add(self, row, links):
+        """Adds a row and its relationship values. Lookup values are listed under their ID, urls under the row's."""
+        for table_name, lookup_table, values in zip(self.relationship_tables, self.lookup_tables, links):
+            if lookup_table is None:
+                self.relationships[table_name][row[0]].extend(values)
             else:
-                info.append(None)
+                for value in values:
+                    self.relationships[table_name][self.registry.get_id(lookup_table, value)].append(row[0])
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.batches += 1
+        if self.batches <= self.committed_batches:  # Already committed by the load being resumed
+            self.reset()
+            return
+
+        insert_into_dimensions(self.cursor, self.registry)
+        owner_ids = [row[0] for row in self.rows]
+        if sync.enabled:
+            upsert_rows(self.cursor, self.table_name, self.columns, self.rows)
         else:
-            info.append(None)
-
-    return info
-
-
-def separate_listy_strings_into_dicts(object_, id_, list_fields, *dicts):
-    """Associates an attribute name with a list of ids"""
-    for i in range(len(list_fields)):
-        string_to_list_object = object_[list_fields[i]]
-        if string_to_list_object != 'unknown':
-            object_types = string_to_list_object.split(', ')
-            for object_type in object_types:
-                dicts[i][object_type].append(id_)
-
-
-def insert_into_planets(cursor):
-    """Insert data into the planet table"""
-    terrain = defaultdict(list)
-    climate = defaultdict(list)
-    desired_columns = ['name', 'rotation_period', 'orbital_period', 'diameter', 'gravity', 'surface_water', 'population']
-    sql = "INSERT INTO planet (ID, Name, RotationPeriod, OrbitalPeriod, Diameter, Gravity, SurfaceWater, Population) " + \
-          "VALUES (%s, %s, %s, %s, %s, %s, %s, %s);"
-    value_list = []
-    response = get_response('planets/')
-    for planet in response:
-        info = get_info(planet, desired_columns)
-        value_list.append(info)
-
-        separate_listy_strings_into_dicts(planet, info[0], ['climate', 'terrain'], climate, terrain)
-        
-    cursor.executemany(sql, value_list)
-    return terrain, climate
-
-
-def insert_into_terrain(cursor, terrain):
-    return convert_into_two_column_entity(cursor, 'terrain', 'Description', terrain)
-
-
-def insert_into_climate(cursor, climate):
-    return convert_into_two_column_entity(cursor, 'climate', 'Description', climate)
-
-
-def insert_into_planet_terrain_rship(cursor, relation_dict):
-    insert_into_relationship(cursor, 'planetTerrain', relation_dict)
-
-
-def insert_into_planet_climate_rship(cursor, relation_dict):
-    insert_into_relationship(cursor, 'planetClimate', relation_dict)
-
-
-def insert_into_species(cursor):
-    """Insert data into the species table"""
-    hair_colors = defaultdict(list)
-    eye_colors = defaultdict(list)
-    skin_colors = defaultdict(list)
-
-    columns = ['name', 'classification', 'designation', 'average_height', 'average_lifespan', 'homeworld', 'language']
-    sql = "INSERT INTO species (ID, Name, Classification, Designation, AverageHeight, AverageLifespan, Homeworld, Language) VALUES (%s, %s, %s, %s, %s, %s, %s, %s);"
-    value_list = []
-
-    response = get_response('species/')
-
-    for species in response:
-        info = get_info(species, columns)
-
-        homeworld = info[-2]
-        info[-2] = int(homeworld.split('/')[-2]) if homeworld else None  # Gets the planet ID out of the API url homeworld
-
-        value_list.append(info)
-        separate_listy_strings_into_dicts(species, info[0], ['hair_colors', 'eye_colors', 'skin_colors'], hair_colors, eye_colors, skin_colors)
-        
-    cursor.executemany(sql, value_list)
-    return hair_colors, eye_colors, skin_colors
-
-
-def insert_into_eye_color(cursor, eye_colors):
-    return convert_into_two_column_entity(cursor, 'eyeColor', 'Color', eye_colors)
-
-def insert_into_eye_color_species_rship(cursor, relation_dict):
-    insert_into_relationship(cursor, 'speciesEyeColor', relation_dict)
-
-
-def insert_into_persons(cursor):
-    """Insert data into the person table"""
-    hair_colors = defaultdict(list)
-    skin_colors = defaultdict(list)
-    desired_columns = ['name', 'height', 'mass', 'birth_year', 'gender', 'homeworld']
-    sql = "INSERT INTO person (ID, Name, Height, Mass, EyeColor, BirthYear, Gender, Homeworld, Species) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s);"
-
-    values_list = []
-    response = get_response('people/')
-
-    for person in response:
-        info = get_info(person, desired_columns)
-
-        eye_color = person['eye_color'].lower()
-        cursor.execute(f"SELECT ID FROM eyeColor WHERE Color = '{eye_color}'")
-        color_row = cursor.fetchone()
-        info.insert(4, int(color_row[0]) if color_row else None)
-
-        homeworld = info[-1]
-        info[-1] = int(homeworld.split('/')[-2]) if homeworld else None  # Gets the planet ID out of the API url homeworld
-        # info[-1] = None  # Delete this line when ready
-
-        species = person['species']
-        info.append(int(species[0].split('/')[-2]) if species else 1)  # Human species isn't attached to characters in the API
-
-        values_list.append(info)
-        separate_listy_strings_into_dicts(person, info[0], ['hair_color', 'skin_color'], hair_colors, skin_colors)
-
-    cursor.executemany(sql, values_list)
-    return hair_colors, skin_colors
-
-
-def insert_into_hair_colors(cursor, hair_colors):
-    convert_into_two_column_entity(cursor, 'hairColor', 'Color', hair_colors)
-
-
-def insert_into_skin_colors(cursor, skin_colors):
-    convert_into_two_column_entity(cursor, 'skinColor', 'Color', skin_colors)
-
-
-def insert_into_species_hair_rship(cursor, relation_dict):
-    insert_into_relationship(cursor, 'speciesHairColor', relation_dict)
-
-
-def insert_into_person_hair_rship(cursor, relation_dict):
-    insert_into_relationship(cursor, 'personHairColor', relation_dict)
-
-
-def insert_into_species_skin_rship(cursor, relation_dict):
-    insert_into_relationship(cursor, 'speciesSkinColor', relation_dict)
-
-
-def insert_into_person_skin_rship(cursor, relation_dict):
-    insert_into_relationship(cursor, 'personSkinColor', relation_dict)
-
-
-def insert_into_starship(cursor):
-    """Insert data into the starship table"""
-    pilots = defaultdict(list)
-    manufacturers = defaultdict(list)
-    desired_columns = ['name', 'model', 'cost_in_credits', 'length', 'max_atmosphering_speed', 'crew', 'passengers', 
-                       'cargo_capacity', 'consumables', 'hyperdrive_rating', 'MGLT', 'starship_class']
-    sql = "INSERT INTO starship (ID, Name, Model, Cost, Length, MaxSpeed, Crew, Passengers, CargoCapacity, Consumables, HyperdriveRating, MGLT, Class) " + \
-          "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);"
-
-    values_list = []
-    response = get_response('starships/')
-
-    for starship in response:
-        info = get_info(starship, desired_columns)
-        info[5] = float(info[5]) if info[5] and str(info[5])[-1].isdigit() else None
-        info[-3] = float(info[-3]) if info[-3] else None
-
-        values_list.append(info)
-        persons = starship['pilots']
-        if persons:
-            for person in persons:
-                pilots[info[0]].append(int(person.split('/')[-2]))
-        
-
-        separate_listy_strings_into_dicts(starship, info[0], ['manufacturer'], manufacturers)
-
-
-    cursor.executemany(sql, values_list)
-    return pilots, manufacturers
-
-
-def insert_into_pilots_rship(cursor, pilots):
-    insert_into_relationship(cursor, 'starshipPerson', pilots)
-
-
-def insert_into_vehicle(cursor):
-    """Insert data into the vehicle table"""
-    drivers = defaultdict(list)
-    manufacturers = defaultdict(list)
-    desired_columns = ['name', 'model', 'cost_in_credits', 'length', 'max_atmosphering_speed', 'crew', 'passengers', 
-                       'cargo_capacity', 'consumables', 'vehicle_class']
-    sql = "INSERT INTO vehicle (ID, Name, Model, Cost, Length, MaxSpeed, Crew, Passengers, CargoCapacity, Consumables, Class) " + \
-          "VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s);"
-
-    values_list = []
-    response = get_response('vehicles/')
-
-    for vehicle in response:
-        info = get_info(vehicle, desired_columns)
-        info[5] = float(info[5]) if info[5] and str(info[5])[-1].isdigit() else None
-        info[-3] = float(info[-3]) if info[-3] else None
-
-        values_list.append(info)
-        persons = vehicle['pilots']
-        if persons:
-            for person in persons:
-                drivers[info[0]].append(int(person.split('/')[-2]))
-        
-
-        separate_listy_strings_into_dicts(vehicle, info[0], ['manufacturer'], manufacturers)
-
-
-    cursor.executemany(sql, values_list)
-    return drivers, manufacturers
-
-
-def insert_into_drivers_rship(cursor, drivers):
-    insert_into_relationship(cursor, 'vehiclePerson', drivers)
-
-
-def insert_into_manufacturers(cursor, manufacturers):
-    convert_into_two_column_entity(cursor, 'manufacturer', 'Name', manufacturers)
-
-
-def insert_into_manufacturers_starship_rship(cursor, manufacturers):
-    insert_into_relationship(cursor, 'manufacturerStarship', manufacturers)
-
-
-def insert_into_manufacturers_vehicle_rship(cursor, manufacturers):
-    insert_into_relationship(cursor, 'manufacturerVehicle', manufacturers)
-
-
-def store_relationship_ids(object_, fieldname, id_, relation_dict):
-    collection = object_[fieldname]
-    for url in collection:
-        relation_dict[id_].append(int(url.split('/')[-2]))
-
-
-def insert_into_films(cursor):
-    """Insert data into the films table"""
-    persons = defaultdict(list)
-    species = defaultdict(list)
-    planets = defaultdict(list)
-    starships = defaultdict(list)
-    vehicles = defaultdict(list)
-    producers = defaultdict(list)
-
-    desired_columns = ['title', 'opening_crawl', 'director', 'release_date']
-    sql = "INSERT INTO films (ID, EpisodeID, Title, OpeningCrawl, Director, ReleaseDate) " + \
-          "VALUES (%s, %s, %s, %s, %s, %s);"
-
-    values_list = []
-    response = get_response('films/')
-
-    for film in response:
-        info = get_info(film, desired_columns)
-        info.insert(1, film['episode_id'])
-        info[-1] = datetime.strptime(info[-1], '%Y-%m-%d')
-        values_list.append(info)
-
-        store_relationship_ids(film, 'characters', info[0], persons)
-        store_relationship_ids(film, 'planets', info[0], planets)
-        store_relationship_ids(film, 'species', info[0], species)
-        store_relationship_ids(film, 'starships', info[0], starships)
-        store_relationship_ids(film, 'vehicles', info[0], vehicles)
-        
-        separate_listy_strings_into_dicts(film, info[0], ['producer'], producers)
-
-    cursor.executemany(sql, values_list)
-    return persons, species, planets, starships, vehicles, producers
-
-
-def insert_into_persons_films_rship(cursor, persons):
-    insert_into_relationship(cursor, 'filmsPersons', persons)
-
-
-def insert_into_species_films_rship(cursor, species):
-    insert_into_relationship(cursor, 'filmsSpecies', species)
-
-
-def insert_into_planets_films_rship(cursor, planets):
-    insert_into_relationship(cursor, 'filmsPlanets', planets)
-
-
-def insert_into_starships_films_rship(cursor, starships):
-    insert_into_relationship(cursor, 'filmsStarships', starships)
-
-
-def insert_into_vehicles_films_rship(cursor, vehicles):
-    insert_into_relationship(cursor, 'filmsVehicles', vehicles)
-
-
-def insert_into_producers(cursor, producers):
-    return convert_into_two_column_entity(cursor, 'producer', 'Name', producers)
-
-
-def insert_into_producers_films_rship(cursor, producers):
-    insert_into_relationship(cursor, 'producerFilms', producers)
-
-
-def main():
-    cursor, connection = connectToMySQL()
-    terrain, climate = insert_into_planets(cursor)
-    terrain_and_planets = insert_into_terrain(cursor, terrain)
-    climate_and_planets = insert_into_climate(cursor, climate)
-    insert_into_planet_terrain_rship(cursor, terrain_and_planets)
-    insert_into_planet_climate_rship(cursor, climate_and_planets)
-
-    species_hair_colors, eye_colors, species_skin_colors = insert_into_species(cursor)
-    species_and_hair_colors = convert_into_two_column_entity(cursor, 'speciesHairColor', 'Color', species_hair_colors, False)
-    species_and_skin_colors = convert_into_two_column_entity(cursor, 'speciesSkinColor', 'Color', species_skin_colors, False)
-    eye_colors_and_species = insert_into_eye_color(cursor, eye_colors)
-    insert_into_eye_color_species_rship(cursor, eye_colors_and_species)
-
-    person_hair_colors, person_skin_colors = insert_into_persons(cursor)
-    person_and_hair_colors = convert_into_two_column_entity(cursor, 'personHairColor', 'Color', person_hair_colors, False)
-    person_and_skin_colors = convert_into_two_column_entity(cursor, 'personSkinColor', 'Color', person_skin_colors, False)
-
-    insert_into_hair_colors(cursor, {**species_hair_colors, **person_hair_colors})
-    insert_into_skin_colors(cursor, {**species_skin_colors, **person_skin_colors})
-    insert_into_species_hair_rship(cursor, species_and_hair_colors)
-    insert_into_person_hair_rship(cursor, person_and_hair_colors)
-    insert_into_species_skin_rship(cursor, species_and_skin_colors)
-    insert_into_person_skin_rship(cursor, person_and_skin_colors)
-
-
-    pilots, manufacturers_starship = insert_into_starship(cursor)
-    insert_into_pilots_rship(cursor, pilots)
-    starship_manufacturers = convert_into_two_column_entity(cursor, 'manufacturerStarship', 'Name', manufacturers_starship, False)
-
-    drivers, manufacturers_vehicle = insert_into_vehicle(cursor)
-    insert_into_drivers_rship(cursor, drivers)
-    vehicle_manufacturers = convert_into_two_column_entity(cursor, 'manufacturerVehicle', 'Name', manufacturers_vehicle, False)
-
-    insert_into_manufacturers(cursor, {**manufacturers_starship, **manufacturers_vehicle})
-    insert_into_manufacturers_starship_rship(cursor, starship_manufacturers)
-    insert_into_manufacturers_vehicle_rship(cursor, vehicle_manufacturers)
-
-    persons, species, planets, starships, vehicles, producers = insert_into_films(cursor)
-    insert_into_persons_films_rship(cursor, persons)
-    insert_into_species_films_rship(cursor, species)
-    insert_into_planets_films_rship(cursor, planets)
-    insert_into_starships_films_rship(cursor, starships)
-    insert_into_vehicles_films_rship(cursor, vehicles)
-
-    producers_and_films = insert_into_producers(cursor, producers)
-    insert_into_producers_films_rship(cursor, producers_and_films)
-
-    connection.commit()
-    cursor.close()
-    connection.close()
+            write_rows(self.cursor, self.table_name, self.columns, self.rows)
+
+        for table_name, relation_dict in self.relationships.items():
+            if table_name in deferred_relationships:
+                deferred_owner_ids, deferred_dict = deferred_relationships[table_name]
+                deferred_owner_ids.extend(owner_ids)
+                for foreign1_id, foreign2_ids in relation_dict.items():
+                    deferred_dict[foreign1_id].extend(foreign2_ids)
+            elif sync.enabled:
+                sync.sync_relationship(self.cursor, table_name, self.table_name + 'ID', owner_ids, relation_dict)
+            else:
+                insert_into_relationship(self.cursor, table_name, relation_dict)
+        self.reset()
+        if checkpoint.enabled:
+            checkpoint.commit_batch(self.cursor, self.table_name, self.batches)
+
+    def finish(self):
+        """Writes whatever is left and records how far the table has been loaded"""
+        self.flush()
+        if self.edited:
+            sync.set_watermark(self.cursor, self.table_name, self.edited)
+        if checkpoint.enabled:
+            checkpoint.complete_stage(self.cursor, self.table_name)
+
+
+def insert_into_entity(cursor, registry, pages, table_name):
+    """Insert data into an entity table along with the relationship tables filled alongside it"""
+    batch = LoadBatch(cursor, registry, table_name)
+
+    for page in batch.pages(pages):
+        for row, links in page:
+            batch.add(row, links)
+
+    batch.finish()
+
+
+# Entity table each endpoint fills
+endpoint_tables = {
+    'planets/': 'planet',
+    'species/': 'species',
+    'people/': 'person',
+    'starships/': 'starship',
+    'vehicles/': 'vehicle',
+    'films/': 'films',
+}
+
+
+def bump_load_version(cursor):
+    cursor.execute("INSERT INTO loadVersion (ID, Version) VALUES (1, 1) ON DUPLICATE KEY UPDATE Version = Version + 1;")
+
+
+def insert_deferred_relationship(cursor, table_name, owner_table):
+    owner_ids, relation_dict = deferred_relationships.pop(table_name)
+    if sync.enabled:
+        sync.sync_relationship(cursor, table_name, owner_table + 'ID', owner_ids, relation_dict)
+    else:
+        insert_into_relationship(cursor, table_name, relation_dict)
+
+
+def cross_entity_relationships():
+    """Relationship tables that reference another endpoint's entity table, like starshipPerson"""
+    references = scheduler.foreign_keys()
+    return {table_name: owner_table for owner_table, tables in relationship_tables.items() for table_name in tables
+            if references[table_name] - {owner_table} - set(dimension_tables)}
+
+
+def load_steps(registry, pages, deferred, ordered=True, completed=()):
+    """Builds a step for each endpoint, plus a step for each deferred relationship table.
+    When ordered, steps wait for the steps writing the tables their foreign keys reference.
+    Endpoints whose table is in completed were loaded by an earlier run and get no step."""
+    steps = []
+    for endpoint, table_name in endpoint_tables.items():
+        if table_name in completed:
+            continue
+        tables = [table_name] + [name for name in relationship_tables[table_name] if name not in deferred]
+        steps.append(scheduler.Step(table_name, partial(insert_into_entity, registry=registry, pages=pages[endpoint],
+                                                        table_name=table_name), tables))
+    for table_name, owner_table in deferred.items():
+        steps.append(scheduler.Step(table_name, partial(insert_deferred_relationship, table_name=table_name, owner_table=owner_table), [table_name]))
+
+    return scheduler.add_dependencies(steps) if ordered else steps
+
+
+def stage_names():
+    """Every stage a load can record: fetching each endpoint, loading each table, and the steps after them"""
+    return ([f'fetch {endpoint}' for endpoint in swapi.endpoints] + list(endpoint_tables.values()) +
+            list(cross_entity_relationships()) + ['add keys', 'commit', 'summaries'])
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Load the Star Wars API into the StarWars database')
+    parser.add_argument('--base-url', default=swapi.base_url, help='root of the API, e.g. a local swapi_server.py')
+    parser.add_argument('--retries', type=int, default=swapi.retries,
+                        help='attempts at a page the API answers with a server error')
+    parser.add_argument('--workers', type=int, default=swapi.max_workers,
+                        help='maximum number of pages fetched concurrently for each endpoint')
+    parser.add_argument('--cache-dir', default='.swapi_cache', help='directory API responses are cached in')
+    parser.add_argument('--cache-ttl', type=int, default=86400,
+                        help='seconds a cached response is used before asking the API if it changed')
+    parser.add_argument('--no-cache', action='store_true', help='always download every page from the API')
+    parser.add_argument('--replay', metavar='SNAPSHOT_DIR',
+                        help='load only from a recorded cache directory, without any network access')
+    parser.add_argument('--bulk', action='store_true',
+                        help='write every table with LOAD DATA LOCAL INFILE instead of executemany')
+    parser.add_argument('--sync', action='store_true',
+                        help='only write rows edited since the last load, updating the ones that already exist')
+    parser.add_argument('--defer-keys', action='store_true',
+                        help='load with foreign key checks off into tables made by create.py --defer-keys, '
+                             'then add the foreign keys and secondary indexes')
+    parser.add_argument('--checkpoint', action='store_true',
+                        help='commit every batch and record it in loadCheckpoint, so a failed load can be resumed')
+    parser.add_argument('--resume', action='store_true',
+                        help='continue a failed --checkpoint load, skipping what it committed and reusing its cached pages')
+    parser.add_argument('--compact', action='store_true',
+                        help='load into tables made by create.py --compact or migrated by compact.py')
+    parser.add_argument('--sqlite', metavar='PATH',
+                        help='load into a SQLite database file made by create.py --sqlite instead of MySQL')
+    parser.add_argument('--connections', type=int, default=1,
+                        help='number of database connections independent tables are loaded on in parallel')
+    parser.add_argument('--batch-size', type=int, default=writers.batch_size,
+                        help='number of rows transformed before they are written to the database')
+    parser.add_argument('--processes', type=int, default=transform.processes,
+                        help='worker processes the pages of large endpoints are transformed in, 1 to transform them '
+                             'on the loading thread')
+    parser.add_argument('--queue-size', type=int, default=4,
+                        help='number of fetched pages each endpoint buffers ahead of the database writes')
+    parser.add_argument('--metrics-json', metavar='PATH', help='write the time, pages, bytes, rows, statements and '
+                                                               'round trips of every stage to a JSON report')
+    parser.add_argument('--metrics-prom', metavar='PATH',
+                        help='write the same measurements in the Prometheus textfile collector format')
+    parser.add_argument('--profile-stage', metavar='STAGE',
+                        help="run one stage, e.g. 'person' or 'fetch people/', under cProfile")
+    parser.add_argument('--profile-output', default='stage.prof', help='file the --profile-stage profile is dumped to')
+    args = parser.parse_args(argv)
+    if args.profile_stage and args.profile_stage not in stage_names():
+        parser.error(f"unknown stage {args.profile_stage!r} for --profile-stage, choose from: " +
+                     ', '.join(repr(name) for name in stage_names()))
+    if args.sqlite and (args.bulk or args.defer_keys or args.connections > 1):
+        parser.error('SQLite has one writer and no LOAD DATA or ALTER TABLE ADD FOREIGN KEY, '
+                     'so --bulk, --defer-keys and --connections need MySQL')
+    if args.defer_keys and (args.sync or args.resume):
+        parser.error('--sync and --resume load into tables that already have their keys, '
+                     'which --defer-keys would add a second time')
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    metrics.reset()
+    metrics.profile_stage = args.profile_stage
+    metrics.profile_output = args.profile_output
+    swapi.base_url = args.base_url
+    swapi.retries = args.retries
+    swapi.max_workers = args.workers  # Before the first request, since the session's connection pool is sized by it
+    if args.replay:
+        swapi.cache = ResponseCache(args.replay, offline=True)
+    elif args.resume:
+        swapi.cache = ResponseCache(args.cache_dir, float('inf'))  # The pages the failed load saw, so its batches line up
+    elif not args.no_cache:
+        swapi.cache = ResponseCache(args.cache_dir, args.cache_ttl)
+
+    create.compact = args.compact
+    writers.bulk = args.bulk
+    writers.batch_size = args.batch_size
+    transform.processes = args.processes
+    sync.enabled = args.sync
+    checkpoint.enabled = args.checkpoint or args.resume
+    if args.sqlite:
+        db.use_sqlite(args.sqlite)
+    connections = [connectToMySQL(allow_local_infile=args.bulk) for _ in range(args.connections)]
+    for cursor, connection in connections:
+        db.backend.begin_load(cursor)
+        if args.defer_keys:
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 0, UNIQUE_CHECKS = 0;")
+    cursor, connection = connections[0]
+    sync.create_watermark_table(cursor)
+    cursor.execute(create.create_load_version_table())
+    checkpoint.create_checkpoint_table(cursor)
+    completed = checkpoint.completed_stages(cursor) if args.resume else set()
+    if checkpoint.enabled and not args.resume:
+        checkpoint.clear(cursor)
+    registry = DimensionRegistry()
+    if args.sync or args.resume:
+        registry.load(cursor)
+
+    # Every endpoint left to load starts fetching in the background now, so writing a table overlaps fetching the next ones
+    pages = {endpoint: prefetch_pages(endpoint, args.workers, args.queue_size)
+             for endpoint in swapi.endpoints if endpoint_tables[endpoint] not in completed}
+
+    parallel = args.connections > 1
+    # Relationships held back in memory would be lost by a failure, so checkpointed loads write them with their owner
+    deferred = cross_entity_relationships() if parallel and not args.defer_keys and not checkpoint.enabled else {}
+    deferred_relationships.clear()
+    deferred_relationships.update({table_name: ([], defaultdict(list)) for table_name in deferred})
+    if parallel:
+        registry_cursor, registry_connection = connectToMySQL(allow_local_infile=args.bulk, autocommit=True)
+        registry.cursor = registry_cursor
+        connections.append((registry_cursor, registry_connection))  # Closed along with the others
+
+    # Serially everything is one transaction, unless every batch is checkpointed.
+    # In parallel each step commits, so the steps after it can see its rows.
+    steps = load_steps(registry, pages, deferred, ordered=not args.defer_keys, completed=completed)
+    scheduler.run_steps(steps, connections[:args.connections], commit_each_step=parallel)
+
+    cursor, connection = connections[0]
+    if args.defer_keys:
+        with metrics.stage('add keys'):
+            metrics.commit(connection)
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 1, UNIQUE_CHECKS = 1;")
+            create.add_keys_and_indexes(cursor)
+
+    with metrics.stage('commit'):
+        metrics.commit(connection)  # Building the summaries is DDL, which would commit the load implicitly anyway
+    with metrics.stage('summaries'):
+        create.refresh_summary_tables(cursor)
+        bump_load_version(cursor)  # Tells query caches to clear
+    if checkpoint.enabled:
+        checkpoint.clear(cursor)
+    metrics.commit(connection)
+    db.backend.end_load(cursor)  # After the commit, since SQLite can't change its safety level inside a transaction
+    transform.close_pool()
+    for cursor, connection in connections:
+        connection.commit()
+        cursor.close()
+        connection.close()
+
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+    if args.metrics_prom:
+        metrics.write_prometheus(args.metrics_prom)
 
 if __name__ == '__main__':
     main()
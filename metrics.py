@@ -0,0 +1,183 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import os
+import re
+import time
+import json
+import cProfile
+import threading
+from contextlib import contextmanager
+
+
+# What is measured for every stage, and what each measurement means in the Prometheus export
+counters = {
+    'seconds': 'Wall time of the stage',
+    'fetch_wait_seconds': 'Time the stage waited for API pages',
+    'transform_seconds': 'Time spent converting API objects into rows',
+    'database_seconds': 'Time spent in database calls',
+    'bytes_fetched': 'Bytes of API responses downloaded',
+    'pages': 'API pages fetched',
+    'cache_hits': 'API pages served from the response cache',
+    'rows_written': 'Rows sent to the database',
+    'statements': 'SQL statements sent to the database',
+    'round_trips': 'Database round trips',
+}
+
+profile_stage = None  # Name of a stage to run under cProfile
+profile_output = 'stage.prof'  # File the profile of profile_stage is dumped to
+
+stages = {}  # Stage name -> counter -> amount
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def reset():
+    with _lock:
+        stages.clear()
+
+
+def current_stage():
+    """The stage running on this thread, None outside of any stage"""
+    return getattr(_local, 'stage', None)
+
+
+def add(stage_name=None, **amounts):
+    """Adds to the counters of a stage, the one running on this thread by default"""
+    stage_name = stage_name or current_stage()
+    if stage_name is None:
+        return
+    with _lock:
+        stage = stages.setdefault(stage_name, dict.fromkeys(counters, 0))
+        for counter, amount in amounts.items():
+            stage[counter] += amount
+
+
+@contextmanager
+def stage(name):
+    """Times a stage and attributes what happens on this thread inside it to the stage"""
+    previous = current_stage()
+    _local.stage = name
+    profiler = cProfile.Profile() if name == profile_stage else None
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile_output)
+        add(name, seconds=time.perf_counter() - start)
+        _local.stage = previous
+
+
+@contextmanager
+def timed(counter, stage_name=None):
+    """Adds the time spent inside to one of the counters of a stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(stage_name, **{counter: time.perf_counter() - start})
+
+
+@contextmanager
+def paused(stage_name=None):
+    """Takes the time spent inside off the wall time of the stage it runs in,
+    e.g. while a generator's stage is suspended waiting for its consumer"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(stage_name, seconds=start - time.perf_counter())
+
+
+def waited(iterable, counter='fetch_wait_seconds'):
+    """Yields from an iterable, adding the time spent waiting for each item to the current stage"""
+    iterator = iter(iterable)
+    while True:
+        with timed(counter):
+            item = next(iterator, StopIteration)
+        if item is StopIteration:
+            return
+        yield item
+
+
+def statement_kind(operation):
+    return operation.lstrip().split(None, 1)[0].upper() if operation.strip() else ''
+
+
+class InstrumentedCursor:
+    """Wraps a cursor, counting the statements, round trips, rows and time of every call for the current stage"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def execute(self, operation, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._cursor.execute(operation, *args, **kwargs)
+        finally:
+            local_file = statement_kind(operation) == 'LOAD'  # The server asks for the file, which costs a round trip
+            written = max(self._cursor.rowcount, 0) if statement_kind(operation) in ('INSERT', 'LOAD', 'UPDATE', 'DELETE') else 0
+            add(database_seconds=time.perf_counter() - start, statements=1, round_trips=2 if local_file else 1,
+                rows_written=written)
+
+    def executemany(self, operation, seq_params, *args, **kwargs):
+        seq_params = list(seq_params)
+        start = time.perf_counter()
+        try:
+            return self._cursor.executemany(operation, seq_params, *args, **kwargs)
+        finally:
+            # The connector rewrites an INSERT ... VALUES into one multi-row statement, anything else runs once per row
+            batched = statement_kind(operation) == 'INSERT' and re.search(r'\bVALUES\s*\(', operation, re.I)
+            sent = 1 if batched or not seq_params else len(seq_params)
+            add(database_seconds=time.perf_counter() - start, statements=sent, round_trips=sent,
+                rows_written=len(seq_params) if statement_kind(operation) == 'INSERT' else 0)
+
+
+def commit(connection):
+    """Commits, counting it as a statement and round trip of the current stage"""
+    with timed('database_seconds'):
+        connection.commit()
+    add(statements=1, round_trips=1)
+
+
+def report():
+    """Returns a copy of every stage's counters, with rows per second"""
+    with _lock:
+        snapshot = {name: dict(stage) for name, stage in stages.items()}
+    for stage in snapshot.values():
+        stage['rows_per_second'] = stage['rows_written'] / stage['seconds'] if stage['seconds'] else 0
+    return snapshot
+
+
+def write_json(path):
+    with open(path, 'w') as file:
+        json.dump({'stages': report()}, file, indent=2)
+
+
+def write_prometheus(path):
+    """Writes every counter in the Prometheus textfile collector format"""
+    snapshot = report()
+    lines = []
+    for counter, description in {**counters, 'rows_per_second': 'Rows written per second of the stage'}.items():
+        metric = f'starwars_load_{counter}'
+        lines.append(f'# HELP {metric} {description}')
+        lines.append(f'# TYPE {metric} gauge')
+        for name, stage in snapshot.items():
+            label = name.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(f'{metric}{{stage="{label}"}} {stage[counter]}')
+    with open(path + '.tmp', 'w') as file:  # The collector may read it at any moment, so it is swapped in whole
+        file.write('\n'.join(lines) + '\n')
+    os.replace(path + '.tmp', path)
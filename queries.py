@@ -0,0 +1,149 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import time
+import threading
+from collections import OrderedDict
+import db
+
+
+cache_size = 1024  # Results kept in memory, the least recently used is evicted first
+cache_ttl = 60  # Seconds a cached result is served before the query runs again
+
+
+class ResultCache:
+    """Least recently used cache whose entries also expire after ttl seconds"""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Returns (True, value) for a live entry and (False, None) otherwise"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            if entry:
+                del self.entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+# A new, empty cache once a load has been committed since the last one was made
+_cache = db.Versioned(lambda: ResultCache(cache_size, cache_ttl))
+
+
+def close():
+    db.close_pool()
+
+
+def invalidate():
+    """Drops every cached result, for callers that know the data just changed"""
+    _cache.get().clear()
+
+
+def run(sql, *params):
+    """Returns the rows of a query, from the cache when it ran recently with the same parameters"""
+    cache = _cache.get()
+    key = (sql, params)
+    hit, rows = cache.get(key)
+    if not hit:
+        rows = db.query(sql, params)
+        cache.put(key, rows)
+    return rows
+
+
+def characters_in_episode(episode_id):
+    """Names of the characters in an episode"""
+    return run("SELECT Name FROM person " +
+               "INNER JOIN filmsPersons ON person.ID = filmsPersons.personID " +
+               "INNER JOIN films ON films.ID = filmsPersons.filmsID " +
+               "WHERE films.EpisodeID = %s ORDER BY Name;", episode_id)
+
+
+def characters_per_film():
+    """(title, number of characters) of each film, from most to fewest characters"""
+    return run("SELECT films.Title, COUNT(*) AS Number_of_People FROM films " +
+               "INNER JOIN filmsPersons ON films.ID = filmsPersons.filmsID " +
+               "INNER JOIN person ON person.ID = filmsPersons.personID " +
+               "GROUP BY films.Title ORDER BY Number_of_People DESC;")
+
+
+def most_expensive_starship_per_species():
+    """(species, cost) of the most expensive starship flown by each species"""
+    return run("SELECT species.Name AS Species, MAX(Cost) AS Cost FROM species " +
+               "INNER JOIN person ON person.Species = species.ID " +
+               "INNER JOIN starshipPerson ON starshipPerson.personID = person.ID " +
+               "INNER JOIN starship ON starship.ID = starshipPerson.starshipID " +
+               "GROUP BY species.Name;")
+
+
+def homeworlds_in_episode(episode_id):
+    """(character, planet) of each character in an episode, by planet name"""
+    return run("SELECT person.Name, planet.Name AS Planet FROM planet " +
+               "INNER JOIN person ON planet.ID = person.Homeworld " +
+               "INNER JOIN filmsPersons ON filmsPersons.personID = person.ID " +
+               "INNER JOIN films ON films.ID = filmsPersons.filmsID " +
+               "WHERE films.EpisodeID = %s ORDER BY planet.Name;", episode_id)
+
+
+def vehicle_manufacturers_of(person_name):
+    """Manufacturers of the vehicles driven by a person"""
+    return run("SELECT manufacturer.Name FROM manufacturer " +
+               "INNER JOIN manufacturerVehicle ON manufacturerVehicle.manufacturerID = manufacturer.ID " +
+               "INNER JOIN vehicle ON vehicle.ID = manufacturerVehicle.vehicleID " +
+               "INNER JOIN vehiclePerson ON vehiclePerson.vehicleID = vehicle.ID " +
+               "INNER JOIN person ON person.ID = vehiclePerson.personID " +
+               "WHERE person.Name = %s;", person_name)
+
+
+def pilot_homeworld_climates_and_terrains(episode_id):
+    """(pilot, climate, terrain) of the homeworld of each starship pilot's species in an episode"""
+    return run("SELECT DISTINCT person.Name AS Pilot, climate.Description AS Climate, terrain.Description AS Terrain FROM films " +
+               "INNER JOIN filmsStarships ON filmsStarships.filmsID = films.ID " +
+               "INNER JOIN starship ON starship.ID = filmsStarships.starshipID " +
+               "INNER JOIN starshipPerson ON starshipPerson.starshipID = starship.ID " +
+               "INNER JOIN person ON person.ID = starshipPerson.personID " +
+               "INNER JOIN species ON species.ID = person.Species " +
+               "INNER JOIN planet ON planet.ID = species.Homeworld " +
+               "INNER JOIN planetClimate ON planetClimate.planetID = planet.ID " +
+               "INNER JOIN climate ON climate.ID = planetClimate.climateID " +
+               "INNER JOIN planetTerrain ON planetTerrain.planetID = planet.ID " +
+               "INNER JOIN terrain ON terrain.ID = planetTerrain.terrainID " +
+               "WHERE films.EpisodeID = %s;", episode_id)
+
+
+def films_per_producer():
+    """(producer, number of films) of each producer"""
+    return run("SELECT producer.Name, COUNT(producer.Name) AS Amount FROM producer " +
+               "INNER JOIN producerFilms ON producerFilms.producerID = producer.ID " +
+               "INNER JOIN films ON films.ID = producerFilms.filmsID " +
+               "GROUP BY producer.Name;")
+
+
+def people_with_surname(surname):
+    """(name, height, mass, eye color) of everyone whose name ends with the surname, like the Skywalkers"""
+    return run("SELECT person.Name, person.Height, person.Mass, eyeColor.Color AS EyeColor FROM person " +
+               "INNER JOIN eyeColor ON eyeColor.ID = person.eyeColor " +
+               "WHERE person.Name LIKE %s ORDER BY person.Name DESC;", '%' + surname)
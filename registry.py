@@ -0,0 +1,56 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import threading
+
+
+# Lookup tables and their value column
+dimension_tables = {
+    'eyeColor': 'Color',
+    'hairColor': 'Color',
+    'skinColor': 'Color',
+    'climate': 'Description',
+    'terrain': 'Description',
+    'manufacturer': 'Name',
+    'producer': 'Name',
+}
+
+
+class DimensionRegistry:
+    """Assigns every value of a lookup table a stable ID the first time it is seen,
+    so foreign keys are resolved in memory instead of by querying the database"""
+
+    def __init__(self):
+        self.ids = {table: {} for table in dimension_tables}
+        self.last_ids = {table: 0 for table in dimension_tables}
+        self.written = {table: 0 for table in dimension_tables}  # How many rows of each table are in the database
+        self.lock = threading.RLock()  # Loaders on different threads share the registry
+        self.cursor = None  # Autocommit cursor new values are written with when loading on several connections
+
+    def load(self, cursor):
+        """Seeds the registry with the values already in the database, so new values get new IDs"""
+        for table, column in dimension_tables.items():
+            cursor.execute(f"SELECT ID, {column} FROM {table} ORDER BY ID;")
+            for id_, value in cursor.fetchall():
+                self.ids[table][value] = id_
+                self.last_ids[table] = max(self.last_ids[table], id_)
+            self.written[table] = len(self.ids[table])
+
+    def get_id(self, table, value):
+        ids = self.ids[table]
+        if value not in ids:
+            with self.lock:
+                if value not in ids:
+                    self.last_ids[table] += 1
+                    ids[value] = self.last_ids[table]
+        return ids[value]
+
+    def pending_rows(self, table):
+        """Returns the (ID, value) rows that haven't been written yet and marks them as written"""
+        with self.lock:
+            rows = list(self.ids[table].items())[self.written[table]:]
+            self.written[table] += len(rows)
+        return [(id_, value) for value, id_ in rows]
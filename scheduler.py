@@ -0,0 +1,75 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import queue
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from create import table_statements, table_name_of, foreign_key_references
+import metrics
+
+
+def foreign_keys():
+    """Returns a dict of table -> set of tables its foreign keys reference, read from the DDL in create.py"""
+    references = {}
+    for statement in table_statements():
+        references[table_name_of(statement)] = set(foreign_key_references(statement).values())
+    return references
+
+
+class Step:
+    """A unit of the load that writes the given tables when called with a cursor"""
+
+    def __init__(self, name, function, tables):
+        self.name = name
+        self.function = function
+        self.tables = tables
+        self.dependencies = set()
+
+
+def add_dependencies(steps):
+    """Makes every step depend on the steps writing the tables its foreign keys reference"""
+    references = foreign_keys()
+    writers = {table_name: step.name for step in steps for table_name in step.tables}
+    for step in steps:
+        for table_name in step.tables:
+            for referenced_table in references.get(table_name, ()):
+                writer = writers.get(referenced_table)
+                if writer and writer != step.name:
+                    step.dependencies.add(writer)
+    return steps
+
+
+def run_steps(steps, connections, commit_each_step=False):
+    """Runs every step as soon as the steps it depends on are done, each on a free (cursor, connection) pair.
+    Steps that run on different connections only see each other's rows once they are committed,
+    so loading on more than one connection needs commit_each_step."""
+    free_connections = queue.Queue()
+    for connection in connections:
+        free_connections.put(connection)
+
+    def run(step):
+        cursor, connection = free_connections.get()
+        try:
+            with metrics.stage(step.name):
+                step.function(cursor)
+                if commit_each_step:
+                    metrics.commit(connection)
+        finally:
+            free_connections.put((cursor, connection))
+
+    done = set()
+    running = {}
+    with ThreadPoolExecutor(len(connections)) as executor:
+        while len(done) < len(steps):
+            for step in steps:
+                if step.name not in done and step.name not in running.values() and step.dependencies <= done:
+                    running[executor.submit(run, step)] = step.name
+            if not running:
+                raise ValueError(f"Load steps depend on each other in a cycle: {[step.name for step in steps if step.name not in done]}")
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                future.result()  # Raises the step's error, if it failed
+                done.add(running.pop(future))
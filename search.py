@@ -0,0 +1,177 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import re
+import argparse
+from collections import defaultdict
+import db
+
+
+# Table -> (column searched, column naming a result). Values are stored lowercased, so search is case-insensitive.
+searchable = {
+    'person': ('Name', 'Name'),
+    'planet': ('Name', 'Name'),
+    'species': ('Name', 'Name'),
+    'starship': ('Name', 'Name'),
+    'vehicle': ('Name', 'Name'),
+    'films': ('OpeningCrawl', 'Title'),
+}
+
+in_process = False  # Answer from a trigram index in this process's memory instead of asking the database
+ngram_token_size = 2  # MySQL's default; shorter searches can't use a FULLTEXT index and fall back to LIKE
+
+
+def normalize(text):
+    return text.lower().strip()
+
+
+def trigrams(text):
+    return {text[start:start + 3] for start in range(len(text) - 2)}
+
+
+def score(text, query):
+    """How well text matches query: 0 without the substring in it, otherwise one per occurrence,
+    plus 3 when it is the whole text, 2 when it starts the text and 1 when it starts a word"""
+    occurrences = text.count(query)
+    if not occurrences:
+        return 0
+    if text == query:
+        return occurrences + 3
+    if text.startswith(query):
+        return occurrences + 2
+    if re.search(r'\b' + re.escape(query), text):
+        return occurrences + 1
+    return occurrences
+
+
+def ranked(results, limit):
+    """The best results first: highest score, then the shortest name"""
+    return sorted(results, key=lambda result: (-result[3], len(result[2] or ''), result[0], result[1]))[:limit]
+
+
+class TrigramIndex:
+    """Every three-character sequence of the searchable text, with the documents it appears in.
+    A search only checks the documents that hold all of its trigrams, instead of every value."""
+
+    def __init__(self):
+        self.documents = []  # (table, ID, name, lowercased text)
+        self.postings = defaultdict(list)  # trigram -> positions in documents, ascending
+
+    def add(self, table_name, id_, label, text):
+        position = len(self.documents)
+        text = normalize(text or '')
+        self.documents.append((table_name, id_, label, text))
+        for trigram in trigrams(text):
+            self.postings[trigram].append(position)
+
+    @classmethod
+    def load(cls, cursor):
+        index = cls()
+        for table_name, (column, label) in searchable.items():
+            cursor.execute(f"SELECT ID, {label}, {column} FROM {table_name} WHERE {column} IS NOT NULL;")
+            for id_, name, text in cursor.fetchall():
+                index.add(table_name, id_, name, text)
+        return index
+
+    def candidates(self, query):
+        """Positions of the documents that could contain query"""
+        if len(query) < 3:
+            return range(len(self.documents))
+        postings = sorted((self.postings.get(trigram, []) for trigram in trigrams(query)), key=len)
+        return set(postings[0]).intersection(*postings[1:])
+
+    def search(self, query, tables=None, limit=20):
+        query = normalize(query)
+        results = []
+        for position in self.candidates(query):
+            table_name, id_, label, text = self.documents[position]
+            if tables and table_name not in tables:
+                continue
+            points = score(text, query)
+            if points:
+                results.append((table_name, id_, label, points))
+        return ranked(results, limit)
+
+
+def fulltext_search(query, tables, limit):
+    """Ranks with MySQL's relevance. Quoting the query makes it a phrase of consecutive n-grams, which is a substring."""
+    phrase = '"' + query.replace('"', '') + '"'
+    results = []
+    for table_name in tables:
+        column, label = searchable[table_name]
+        rows = db.query(f"SELECT ID, {label}, MATCH({column}) AGAINST (%s IN BOOLEAN MODE) AS Score FROM {table_name} " +
+                        f"WHERE MATCH({column}) AGAINST (%s IN BOOLEAN MODE) ORDER BY Score DESC LIMIT %s;",
+                        (phrase, phrase, limit))
+        results.extend((table_name, id_, name, float(points)) for id_, name, points in rows)
+    return ranked(results, limit)
+
+
+def like_search(query, tables, limit):
+    """Scans with LIKE and ranks in Python, for databases without FULLTEXT indexes and for very short queries"""
+    pattern = '%' + re.sub(r'([!%_])', r'!\1', query) + '%'
+    results = []
+    for table_name in tables:
+        column, label = searchable[table_name]
+        rows = db.query(f"SELECT ID, {label}, {column} FROM {table_name} WHERE {column} LIKE %s ESCAPE '!';", (pattern,))
+        results.extend((table_name, id_, name, score(normalize(text), query)) for id_, name, text in rows)
+    return ranked(results, limit)
+
+
+def load():
+    with db.pooled_connection() as connection:
+        cursor = connection.cursor()
+        index = TrigramIndex.load(cursor)
+        cursor.close()
+    return index
+
+
+_index = db.Versioned(load)
+
+
+def refresh():
+    """Rebuilds the in-process index from the database. Searches use the previous one until it is swapped in."""
+    return _index.refresh()
+
+
+def get_index():
+    """The in-process index, rebuilt once a load has been committed since it was built"""
+    return _index.get()
+
+
+def search(query, tables=None, limit=20):
+    """(table, ID, name, score) of the names and crawls containing query, best first.
+    tables limits the search to some of the searchable tables. The in-process index answers when in_process is set,
+    otherwise the database does, through its FULLTEXT indexes where it has them."""
+    query = normalize(query)
+    tables = [table_name for table_name in searchable if not tables or table_name in tables]
+    if not query:
+        return []
+    if in_process:
+        return get_index().search(query, tables, limit)
+    if db.backend.fulltext and len(query) >= ngram_token_size:
+        return fulltext_search(query, tables, limit)
+    return like_search(query, tables, limit)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search the names and opening crawls of the StarWars database')
+    parser.add_argument('query', help='text to find anywhere in a name or crawl, e.g. skywalker')
+    parser.add_argument('--table', action='append', choices=list(searchable), help='only search this table, repeatable')
+    parser.add_argument('--limit', type=int, default=20, help='number of results to print')
+    parser.add_argument('--in-process', action='store_true', help='build a trigram index in memory and search that')
+    parser.add_argument('--sqlite', metavar='PATH', help='search a SQLite database file instead of MySQL')
+    args = parser.parse_args()
+
+    global in_process
+    in_process = args.in_process
+    if args.sqlite:
+        db.use_sqlite(args.sqlite)
+    for table_name, id_, name, points in search(args.query, args.table, args.limit):
+        print(f"{points:8.2f}  {table_name:10} {id_:6}  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import os
+import time
+import json
+import hashlib
+import zipfile
+import argparse
+import tempfile
+from datetime import datetime, timezone
+from functools import partial
+import create
+import db
+import metrics
+import scheduler
+import writers
+from writers import tsv_field, tsv_values
+from insert import connectToMySQL, bump_load_version
+
+
+bundle_format = 'starwars-snapshot'
+format_version = 1  # Bumped whenever a bundle written by this version can't be restored by an older one
+fetch_size = 5000  # Rows read from the database at a time while exporting
+
+
+def table_columns(statement):
+    return [column for column, _, _ in create.column_definitions(statement)]
+
+
+def export_snapshot(cursor, path):
+    """Writes every table to a zip bundle: one member per table in the TSV format LOAD DATA reads, compressed,
+    plus a manifest.json with the format version, the schema profile and each table's columns, row count and SHA-256.
+    Every table is read in one transaction, so the bundle is consistent even while a load runs.
+    The transaction only reads, and ends when the caller closes the connection."""
+    manifest = {'format': bundle_format, 'version': format_version, 'compact': create.compact,
+                'created': datetime.now(timezone.utc).isoformat(timespec='seconds'), 'tables': {}}
+    db.backend.begin_snapshot(cursor)
+    with zipfile.ZipFile(path + '.tmp', 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as bundle:
+        for statement in create.table_statements():
+            table_name = create.table_name_of(statement)
+            columns = table_columns(statement)
+            digest = hashlib.sha256()
+            row_count = 0
+            cursor.execute(f"SELECT {', '.join(columns)} FROM {table_name};")
+            with bundle.open(f'tables/{table_name}.tsv', 'w') as member:
+                for rows in iter(partial(cursor.fetchmany, fetch_size), []):
+                    data = ''.join('\t'.join(tsv_field(value) for value in row) + '\n' for row in rows).encode('utf-8')
+                    digest.update(data)
+                    member.write(data)
+                    row_count += len(rows)
+            manifest['tables'][table_name] = {'columns': columns, 'rows': row_count, 'sha256': digest.hexdigest()}
+        bundle.writestr('manifest.json', json.dumps(manifest, indent=2))
+    os.replace(path + '.tmp', path)  # A bundle that exists is always complete
+    return manifest
+
+
+def read_manifest(bundle):
+    manifest = json.loads(bundle.read('manifest.json'))
+    if manifest.get('format') != bundle_format:
+        raise ValueError(f"Not a snapshot bundle: {bundle.filename}")
+    if manifest['version'] > format_version:
+        raise ValueError(f"{bundle.filename} is snapshot format {manifest['version']}, this version reads up to {format_version}")
+    return manifest
+
+
+def extract_table(bundle, table_name, info, directory):
+    """Decompresses a table's member to a file, raising ValueError when it doesn't match the manifest's checksum"""
+    path = os.path.join(directory, f'{table_name}.tsv')
+    digest = hashlib.sha256()
+    with bundle.open(f'tables/{table_name}.tsv') as member, open(path, 'wb') as file:
+        for chunk in iter(partial(member.read, 1 << 20), b''):
+            digest.update(chunk)
+            file.write(chunk)
+    if digest.hexdigest() != info['sha256']:
+        raise ValueError(f"Checksum mismatch for {table_name} in {bundle.filename}, the bundle is corrupt")
+    return path
+
+
+def load_table(cursor, path, table_name, columns):
+    """Bulk loads a table's file: LOAD DATA where the backend has it, otherwise executemany in batches"""
+    if db.backend.load_data:
+        writers.load_data_file(cursor, table_name, columns, path)
+        return
+    with open(path, encoding='utf-8', newline='') as file:
+        batch = []
+        for line in file:
+            batch.append(tsv_values(line))
+            if len(batch) >= writers.batch_size:
+                writers.insert_rows(cursor, table_name, columns, batch)
+                batch = []
+        if batch:
+            writers.insert_rows(cursor, table_name, columns, batch)
+
+
+def check_no_tables():
+    """Exits if the SQLite file already has StarWars tables, which restoring without --replace would collide with"""
+    cursor, connection = create.connectToMySQL()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table';")
+    existing = {name for name, in cursor.fetchall()}
+    cursor.close()
+    connection.close()
+    if existing & {create.table_name_of(statement) for statement in create.table_statements()}:
+        print(f"{db.backend.path} already has the StarWars tables, restore with --replace to drop them first")
+        exit(1)
+
+
+def restore_schema(replace=False):
+    """Creates the database and its tables without foreign keys or secondary indexes where the backend can add them later.
+    With replace an existing database is dropped first."""
+    cursor, connection = create.connectToMySQL()
+    if db.backend.databases:
+        if replace:
+            cursor.execute(f"DROP DATABASE IF EXISTS {db.database};")
+        create.createDatabase(cursor, db.database)
+        cursor.execute(f"USE {db.database}")
+    elif replace:
+        cursor.execute("PRAGMA foreign_keys = OFF;")
+        for statement in reversed(create.table_statements()):
+            cursor.execute(f"DROP TABLE IF EXISTS {create.table_name_of(statement)};")
+        for table_name, _, _ in create.summary_tables():
+            cursor.execute(f"DROP TABLE IF EXISTS {table_name};")
+    create.create_tables(cursor, defer_keys=db.backend.deferred_keys)
+    cursor.close()
+    connection.close()
+
+
+def restore_snapshot(path, connections=4, replace=False):
+    """Recreates the schema and loads every table of a bundle, in parallel on MySQL with the keys added afterwards.
+    Every table's checksum is verified before any of it is loaded."""
+    with zipfile.ZipFile(path) as bundle, tempfile.TemporaryDirectory() as directory:
+        manifest = read_manifest(bundle)
+        create.compact = manifest['compact']
+        if not db.backend.databases and not replace:
+            check_no_tables()
+        with metrics.stage('verify'):
+            paths = {table_name: extract_table(bundle, table_name, info, directory)
+                     for table_name, info in manifest['tables'].items()}
+
+        restore_schema(replace)
+        if not db.backend.deferred_keys:
+            connections = 1  # One writer, loading the tables in foreign key order
+        pairs = [connectToMySQL(allow_local_infile=True) for _ in range(connections)]
+        for cursor, connection in pairs:
+            db.backend.begin_load(cursor)
+            if db.backend.deferred_keys:
+                cursor.execute("SET FOREIGN_KEY_CHECKS = 0, UNIQUE_CHECKS = 0;")
+        steps = [scheduler.Step(table_name, partial(load_table, path=paths[table_name], table_name=table_name,
+                                                    columns=info['columns']), [table_name])
+                 for table_name, info in manifest['tables'].items() if info['rows']]
+        if not db.backend.deferred_keys:
+            scheduler.add_dependencies(steps)
+        scheduler.run_steps(steps, pairs, commit_each_step=len(pairs) > 1)
+
+        cursor, connection = pairs[0]
+        if db.backend.deferred_keys:
+            with metrics.stage('add keys'):
+                metrics.commit(connection)
+                cursor.execute("SET FOREIGN_KEY_CHECKS = 1, UNIQUE_CHECKS = 1;")
+                create.add_keys_and_indexes(cursor)
+        with metrics.stage('summaries'):
+            metrics.commit(connection)
+            create.refresh_summary_tables(cursor)
+            bump_load_version(cursor)  # Tells query caches to clear
+        metrics.commit(connection)
+        db.backend.end_load(cursor)
+        for cursor, connection in pairs:
+            connection.commit()
+            cursor.close()
+            connection.close()
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Export the StarWars database to a snapshot bundle, or restore one')
+    parser.add_argument('command', choices=['export', 'restore'])
+    parser.add_argument('bundle', help='snapshot file to write or read, e.g. starwars.snapshot')
+    parser.add_argument('--connections', type=int, default=4, help='connections tables are restored on in parallel')
+    parser.add_argument('--replace', action='store_true', help='drop an existing database before restoring')
+    parser.add_argument('--sqlite', metavar='PATH', help='use a SQLite database file instead of MySQL')
+    parser.add_argument('--compact', action='store_true', help='export tables made by create.py --compact')
+    args = parser.parse_args()
+
+    if args.sqlite:
+        db.use_sqlite(args.sqlite)
+    metrics.reset()
+    if args.command == 'export':
+        create.compact = args.compact
+        cursor, connection = connectToMySQL()
+        manifest = export_snapshot(cursor, args.bundle)
+        cursor.close()
+        connection.close()
+        print(f"Wrote {sum(info['rows'] for info in manifest['tables'].values())} rows of "
+              f"{len(manifest['tables'])} tables to {args.bundle}")
+    else:
+        start = time.perf_counter()
+        manifest = restore_snapshot(args.bundle, args.connections, args.replace)
+        seconds = time.perf_counter() - start
+        print(f"Restored {sum(info['rows'] for info in manifest['tables'].values())} rows of "
+              f"{len(manifest['tables'])} tables from {args.bundle} in {seconds:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import math
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import metrics
+
+
+base_url = 'https://swapi.dev/api/'
+max_workers = 8  # Concurrent page requests per endpoint
+retries = 5  # Attempts at a page the API answered with a server error, with exponential backoff
+endpoints = ['planets/', 'species/', 'people/', 'starships/', 'vehicles/', 'films/']
+cache = None  # ResponseCache used by get_page, None to always hit the API
+
+_session = None
+
+
+def get_session():
+    """Returns the shared HTTP session, so every page request reuses pooled connections.
+    The pool holds a connection for each of max_workers requests of every endpoint."""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=0.2, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=['GET'])
+        adapter = HTTPAdapter(pool_connections=len(endpoints), pool_maxsize=max_workers * len(endpoints), max_retries=retry)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+
+    return _session
+
+
+def get_page(url, stage_name=None):
+    """Get a single page of results from the REST API, going through the response cache when there is one.
+    The page is counted towards the given metrics stage."""
+    if cache is None:
+        response = get_session().get(url)
+        response.raise_for_status()
+        metrics.add(stage_name, pages=1, bytes_fetched=len(response.content))
+        return response.json()
+
+    entry = cache.get(url)
+    if cache.offline:
+        if entry is None:
+            raise LookupError(f"{url} is not in the snapshot at {cache.directory}")
+        metrics.add(stage_name, pages=1, cache_hits=1)
+        return entry['data']
+    if entry and cache.is_fresh(entry):
+        metrics.add(stage_name, pages=1, cache_hits=1)
+        return entry['data']
+
+    response = get_session().get(url, headers=cache.revalidation_headers(entry))
+    if response.status_code == 304 and entry:
+        metrics.add(stage_name, pages=1, cache_hits=1)
+        return cache.touch(url, entry)['data']
+    response.raise_for_status()
+    metrics.add(stage_name, pages=1, bytes_fetched=len(response.content))
+    data = response.json()
+    cache.put(url, data, response.headers)
+    return data
+
+
+def page_url(next_url, page):
+    """Builds the url of the given page number from the API's 'next' url"""
+    parts = urlparse(next_url)
+    query = parse_qs(parts.query)
+    query['page'] = [str(page)]
+    return urlunparse(parts._replace(query=urlencode(query, doseq=True)))
+
+
+def get_pages(endpoint, workers=None):
+    """Yields the endpoint's results one page at a time, as the 'fetch <endpoint>' metrics stage.
+    The stage is paused while the caller holds a page, so its time is only the time spent fetching."""
+    stage_name = f'fetch {endpoint}'
+    with metrics.stage(stage_name):
+        for page in fetch_pages(endpoint, stage_name, workers or max_workers):
+            with metrics.paused(stage_name):
+                yield page
+
+
+def fetch_pages(endpoint, stage_name, workers):
+    """The first page gives the total count, so the following pages are fetched concurrently,
+    keeping at most `workers` requests ahead of the caller.
+    A stage run under cProfile requests every page on this thread, the only one the profiler sees."""
+    data = get_page(base_url + endpoint, stage_name)
+    yield data['results']
+    if not data['next'] or not data['results']:
+        return
+
+    page_count = math.ceil(data['count'] / len(data['results']))
+    urls = (page_url(data['next'], page) for page in range(2, page_count + 1))
+    if stage_name == metrics.profile_stage:
+        for url in urls:
+            yield get_page(url, stage_name)['results']
+        return
+    with ThreadPoolExecutor(workers) as executor:
+        in_flight = deque(executor.submit(get_page, url, stage_name) for _, url in zip(range(workers), urls))
+        while in_flight:
+            page = in_flight.popleft().result()  # Oldest request first keeps the pages in order
+            url = next(urls, None)
+            if url:
+                in_flight.append(executor.submit(get_page, url, stage_name))
+            yield page['results']
+
+
+def prefetch_pages(endpoint, workers=None, queue_size=4):
+    """Starts fetching the endpoint on a background thread and returns a generator over its pages.
+    The queue is bounded, so fetching stays at most queue_size pages ahead of whoever consumes them."""
+    pages = queue.Queue(queue_size)
+
+    def fetch():
+        try:
+            for page in get_pages(endpoint, workers):
+                pages.put(page)
+            pages.put(None)
+        except Exception as err:
+            pages.put(err)
+
+    threading.Thread(target=fetch, daemon=True).start()
+
+    def consume():
+        while True:
+            page = pages.get()
+            if page is None:
+                return
+            if isinstance(page, Exception):
+                raise page
+            yield page
+
+    return consume()
+
@@ -0,0 +1,160 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import os
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import synthetic
+
+
+def load_snapshot(directory):
+    """Returns a dict of endpoint -> objects from a recorded cache directory, in ID order"""
+    objects = {}
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json'):
+            continue
+        with open(os.path.join(directory, filename)) as file:
+            entry = json.load(file)
+        endpoint = urlparse(entry['url']).path.rstrip('/').split('/')[-1] + '/'
+        for object_ in entry['data']['results']:
+            objects.setdefault(endpoint, {})[object_['url']] = object_
+
+    return {endpoint: sorted(by_url.values(), key=lambda object_: int(object_['url'].split('/')[-2]))
+            for endpoint, by_url in objects.items()}
+
+
+def synthetic_objects(scale=1, seed=0, base_url=None):
+    return {endpoint: list(synthetic.generate_objects(endpoint, scale, seed, base_url)) for endpoint in synthetic.base_counts}
+
+
+class SwapiServer(ThreadingHTTPServer):
+    """Serves objects in the API's pagination format, with optional latency, bandwidth cap and errors"""
+    daemon_threads = True
+
+    def __init__(self, address, objects, page_size=10, latency=0, throughput=None, error_rate=0, seed=0):
+        super().__init__(address, SwapiHandler)
+        self.objects = objects
+        self.page_size = page_size
+        self.latency = latency  # Seconds added to every request
+        self.throughput = throughput  # Bytes per second shared by all responses, None for no cap
+        self.error_rate = error_rate  # Fraction of requests answered with 503 Service Unavailable
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.link_free_at = 0  # When the shared link finishes sending what is already queued on it
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/api/'
+
+    def should_fail(self):
+        with self.lock:
+            self.requests += 1
+            failed = self.random.random() < self.error_rate
+            self.errors += failed
+        return failed
+
+    def transmission_delay(self, size):
+        """Seconds until a response of the given size has gone through the shared link"""
+        if not self.throughput:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            self.link_free_at = max(now, self.link_free_at) + size / self.throughput
+            return self.link_free_at - now
+
+    def page(self, endpoint, page):
+        """Returns the API's response for a page of the endpoint, or None when there is no such page"""
+        objects = self.objects.get(endpoint)
+        if objects is None:
+            return None
+        page_count = math.ceil(len(objects) / self.page_size)
+        if not 1 <= page <= max(page_count, 1):  # An empty endpoint still has its first page
+            return None
+        url = f'{self.base_url}{endpoint}?page='
+        return {
+            'count': len(objects),
+            'next': f'{url}{page + 1}' if page < page_count else None,
+            'previous': f'{url}{page - 1}' if page > 1 else None,
+            'results': objects[(page - 1) * self.page_size:page * self.page_size],
+        }
+
+
+class SwapiHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        time.sleep(self.server.latency + self.server.transmission_delay(len(body)))
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split('/') if part]
+        if self.server.should_fail():
+            self.send_json(503, {'detail': 'Service unavailable'})
+        elif parts == ['api']:
+            self.send_json(200, {endpoint[:-1]: self.server.base_url + endpoint for endpoint in self.server.objects})
+        elif len(parts) == 2 and parts[0] == 'api':
+            try:
+                page = int(parse_qs(url.query).get('page', ['1'])[0])
+            except ValueError:
+                page = 0
+            data = self.server.page(parts[1] + '/', page)
+            if data:
+                self.send_json(200, data)
+            else:
+                self.send_json(404, {'detail': 'Not found'})
+        else:
+            self.send_json(404, {'detail': 'Not found'})
+
+
+def serve_in_background(server):
+    """Starts the server on a daemon thread, for benchmarks that run the loader in the same process"""
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a stand-in for the Star Wars API from a snapshot or synthetic data')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--snapshot', help='recorded cache directory to serve, instead of synthetic data')
+    parser.add_argument('--scale', type=float, default=1, help='scale of the synthetic data')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic data and the injected errors')
+    parser.add_argument('--page-size', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to every request')
+    parser.add_argument('--throughput', type=float, help='bytes per second shared by all responses')
+    parser.add_argument('--error-rate', type=float, default=0, help='fraction of requests answered with 503')
+    args = parser.parse_args()
+
+    base_url = f'http://{args.host}:{args.port}/api/'
+    objects = load_snapshot(args.snapshot) if args.snapshot else synthetic_objects(args.scale, args.seed, base_url)
+    server = SwapiServer((args.host, args.port), objects, args.page_size, args.latency, args.throughput, args.error_rate, args.seed)
+    print(f"Serving {sum(map(len, objects.values()))} objects at {base_url}, load them with: " +
+          f"python insert.py --no-cache --base-url {base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"{server.requests} requests, {server.errors} injected errors")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+from create import create_sync_watermark_table
+
+
+enabled = False  # Only write what changed since the last load, updating rows that already exist
+
+
+def create_watermark_table(cursor):
+    cursor.execute(create_sync_watermark_table())
+
+
+def get_watermark(cursor, table_name):
+    """Returns the newest 'edited' timestamp loaded into the table, or None if it was never loaded"""
+    cursor.execute("SELECT Edited FROM syncWatermark WHERE TableName = %s;", (table_name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def set_watermark(cursor, table_name, edited):
+    cursor.execute("INSERT INTO syncWatermark (TableName, Edited) VALUES (%s, %s) " +
+                   "ON DUPLICATE KEY UPDATE Edited = VALUES(Edited);", (table_name, edited))
+
+
+def sync_relationship(cursor, table_name, owner_column, owner_ids, dict_of_relationship):
+    """Makes the relationship rows of the given owners match the dict,
+    inserting the missing pairs and deleting the ones that are gone"""
+    if not owner_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(owner_ids))
+    cursor.execute(f"SELECT * FROM {table_name} WHERE {owner_column} IN ({placeholders});", list(owner_ids))
+    existing = set(cursor.fetchall())
+    first_column, second_column = cursor.column_names
+
+    wanted = {(foreign2_id, foreign1_id) for foreign1_id in dict_of_relationship for foreign2_id in dict_of_relationship[foreign1_id]}
+    missing = sorted(wanted - existing)
+    removed = sorted(existing - wanted)
+    if removed:
+        cursor.executemany(f"DELETE FROM {table_name} WHERE {first_column} = %s AND {second_column} = %s;", removed)
+    if missing:
+        cursor.executemany(f"INSERT INTO {table_name} VALUES (%s, %s);", missing)
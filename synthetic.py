@@ -0,0 +1,217 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import math
+import random
+import argparse
+from datetime import datetime, timedelta
+import swapi
+from cache import ResponseCache
+
+
+# Objects of each endpoint in the real API, a scale factor of 1 generates the same amount
+base_counts = {
+    'planets/': 60,
+    'species/': 37,
+    'people/': 82,
+    'starships/': 36,
+    'vehicles/': 39,
+    'films/': 6,
+}
+
+climates = ['arid', 'temperate', 'tropical', 'frozen', 'murky', 'windy', 'hot', 'humid', 'artificial temperate',
+            'frigid', 'polluted', 'superheated', 'subarctic', 'rocky', 'moist', 'arctic']
+terrains = ['desert', 'grasslands', 'mountains', 'jungle', 'rainforests', 'tundra', 'ice caves', 'swamp', 'forests',
+            'gas giant', 'lakes', 'cityscape', 'ocean', 'volcanoes', 'hills', 'plains', 'canyons', 'caves', 'savanna']
+hair_colors = ['blond', 'brown', 'black', 'auburn', 'white', 'grey', 'red', 'none', 'n/a', 'brown, grey', 'auburn, white']
+eye_colors = ['blue', 'yellow', 'red', 'brown', 'blue-gray', 'black', 'orange', 'hazel', 'pink', 'gold', 'green', 'white']
+skin_colors = ['fair', 'gold', 'white, blue', 'light', 'white, red', 'green', 'green-tan, brown', 'pale', 'metal',
+               'dark', 'brown mottle', 'grey', 'mottled green', 'orange', 'blue, grey', 'tan']
+manufacturers = ['Corellian Engineering Corporation', 'Kuat Drive Yards', 'Sienar Fleet Systems', 'Incom Corporation',
+                 'Koensayr Manufacturing', 'Cygnus Spaceworks', 'Gallofree Yards, Inc.', 'Theed Palace Space Vessel Engineering Corps',
+                 'Aratech Repulsor Company', 'Baktoid Armor Workshop', 'SoroSuub Corporation', 'Mobquet Swoops and Speeders']
+producers = ['Gary Kurtz', 'Rick McCallum', 'Howard G. Kazanjian', 'George Lucas']
+directors = ['George Lucas', 'Irvin Kershner', 'Richard Marquand']
+classifications = ['mammal', 'artificial', 'sentient', 'gastropod', 'reptile', 'amphibian', 'insectoid', 'unknown']
+starship_classes = ['Starfighter', 'Deep Space Mobile Battlestation', 'Light freighter', 'Star Destroyer', 'Corvette',
+                    'Transport', 'Patrol craft', 'Assault starfighter']
+vehicle_classes = ['wheeled', 'repulsorcraft', 'starfighter', 'airspeeder', 'speeder', 'walker', 'submarine', 'sail barge']
+genders = ['male', 'female', 'n/a', 'hermaphrodite', 'none']
+consumables = ['1 week', '2 months', '3 years', '1 day', 'none', 'unknown', '6 months']
+crawl = 'It is a period of civil war. Rebel spaceships, striking from a hidden base, have won their first victory ' + \
+        'against the evil Galactic Empire.\r\n\r\nDuring the battle, Rebel spies managed to steal secret plans ' + \
+        "to the Empire's ultimate weapon, the DEATH STAR."
+
+
+def vocabulary(words, scale):
+    """Grows a list of lookup values with the scale factor, so lookup tables scale along with everything else"""
+    return words + [f'{word} {copy}' for copy in range(2, math.ceil(scale) + 1) for word in words]
+
+
+def count(endpoint, scale):
+    return max(1, round(base_counts[endpoint] * scale))
+
+
+def url(base_url, endpoint, id_):
+    return f'{base_url}{endpoint}{id_}/'
+
+
+def some(rand, words, most=3):
+    """A comma separated string of up to `most` different words, like the API's climates and colors"""
+    return ', '.join(rand.sample(words, rand.randint(1, min(most, len(words)))))
+
+
+def maybe_unknown(rand, value, chance=0.1):
+    return 'unknown' if rand.random() < chance else value
+
+
+def numeric(rand, low, high, chance_unknown=0.1):
+    value = rand.randint(low, high)
+    return maybe_unknown(rand, f'{value:,}' if value >= 1000 else str(value), chance_unknown)
+
+
+def edited(rand):
+    stamp = datetime(2014, 12, 9) + timedelta(seconds=rand.randint(0, 30 * 24 * 3600), microseconds=rand.randint(0, 999) * 1000)
+    return stamp.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def references(rand, base_url, endpoint, total, low, high):
+    """Urls of between low and high distinct objects of the endpoint"""
+    amount = min(total, rand.randint(low, high))
+    return [url(base_url, endpoint, id_) for id_ in sorted(rand.sample(range(1, total + 1), amount))]
+
+
+def generate_objects(endpoint, scale=1, seed=0, base_url=None):
+    """Yields SWAPI shaped objects of the endpoint in ID order.
+    The same endpoint, scale and seed always give the same objects."""
+    base_url = base_url or swapi.base_url
+    rand = random.Random(f'{seed}-{endpoint}')
+    counts = {name: count(name, scale) for name in base_counts}
+
+    for id_ in range(1, counts[endpoint] + 1):
+        object_ = {'url': url(base_url, endpoint, id_), 'edited': edited(rand)}
+        if endpoint == 'planets/':
+            object_.update({
+                'name': f'Planet {id_}',
+                'rotation_period': numeric(rand, 6, 60),
+                'orbital_period': numeric(rand, 200, 5000),
+                'diameter': numeric(rand, 0, 120000),
+                'gravity': maybe_unknown(rand, f'{rand.choice([0.5, 0.75, 1, 1.5])} standard'),
+                'surface_water': numeric(rand, 0, 100),
+                'population': numeric(rand, 0, 10 ** 12, 0.2),
+                'climate': maybe_unknown(rand, some(rand, vocabulary(climates, scale))),
+                'terrain': maybe_unknown(rand, some(rand, vocabulary(terrains, scale))),
+            })
+        elif endpoint == 'species/':
+            object_.update({
+                'name': f'Species {id_}',
+                'classification': rand.choice(classifications),
+                'designation': rand.choice(['sentient', 'reptilian']),
+                'average_height': numeric(rand, 30, 300),
+                'average_lifespan': maybe_unknown(rand, rand.choice([str(rand.randint(50, 1000)), 'indefinite'])),
+                'homeworld': url(base_url, 'planets/', rand.randint(1, counts['planets/'])) if rand.random() < 0.9 else None,
+                'language': rand.choice(['Galactic Basic', 'Shyriiwook', 'Huttese', 'Ewokese', 'n/a']),
+                'hair_colors': maybe_unknown(rand, some(rand, vocabulary(hair_colors, scale))),
+                'eye_colors': maybe_unknown(rand, some(rand, vocabulary(eye_colors, scale))),
+                'skin_colors': maybe_unknown(rand, some(rand, vocabulary(skin_colors, scale))),
+            })
+        elif endpoint == 'people/':
+            object_.update({
+                'name': f'Person {id_}' if rand.random() < 0.95 else f'Person {id_} Skywalker',
+                'height': numeric(rand, 60, 260),
+                'mass': numeric(rand, 15, 1400, 0.2),
+                'hair_color': rand.choice(vocabulary(hair_colors, scale)),
+                'skin_color': rand.choice(vocabulary(skin_colors, scale)),
+                'eye_color': maybe_unknown(rand, rand.choice(vocabulary(eye_colors, scale))),
+                'birth_year': maybe_unknown(rand, f'{rand.randint(1, 900)}BBY'),
+                'gender': rand.choice(genders),
+                'homeworld': url(base_url, 'planets/', rand.randint(1, counts['planets/'])),
+                'species': [url(base_url, 'species/', rand.randint(1, counts['species/']))] if rand.random() < 0.6 else [],
+            })
+        elif endpoint in ('starships/', 'vehicles/'):
+            object_.update({
+                'name': f'{endpoint[:-2].capitalize()} {id_}',
+                'model': f'Model {rand.randint(1, 999)}',
+                'manufacturer': some(rand, vocabulary(manufacturers, scale), 2),
+                'cost_in_credits': numeric(rand, 1000, 10 ** 12, 0.2),
+                'length': numeric(rand, 3, 19000, 0),
+                'max_atmosphering_speed': rand.choice([str(rand.randint(100, 1500)), f'{rand.randint(100, 1500)}km', 'n/a']),
+                'crew': rand.choice([str(rand.randint(1, 20)), '30-165', '342,953']),
+                'passengers': numeric(rand, 0, 90000),
+                'cargo_capacity': numeric(rand, 0, 10 ** 12),
+                'consumables': rand.choice(consumables),
+                'pilots': references(rand, base_url, 'people/', counts['people/'], 0, 2) if rand.random() < 0.4 else [],
+            })
+            if endpoint == 'starships/':
+                object_.update({
+                    'hyperdrive_rating': maybe_unknown(rand, str(rand.choice([0.5, 1.0, 2.0, 3.0, 4.0]))),
+                    'MGLT': numeric(rand, 10, 120),
+                    'starship_class': rand.choice(starship_classes),
+                })
+            else:
+                object_['vehicle_class'] = rand.choice(vehicle_classes)
+        elif endpoint == 'films/':
+            object_.update({
+                'title': f'Episode {id_}',
+                'episode_id': id_,
+                'opening_crawl': crawl,
+                'director': rand.choice(directors),
+                'producer': some(rand, vocabulary(producers, scale), 2),
+                'release_date': (datetime(1977, 5, 25) + timedelta(days=rand.randint(0, 15000))).strftime('%Y-%m-%d'),
+                # The real films reference about a third of everything there is
+                'characters': references(rand, base_url, 'people/', counts['people/'], 15, 40),
+                'planets': references(rand, base_url, 'planets/', counts['planets/'], 3, 13),
+                'species': references(rand, base_url, 'species/', counts['species/'], 5, 25),
+                'starships': references(rand, base_url, 'starships/', counts['starships/'], 5, 15),
+                'vehicles': references(rand, base_url, 'vehicles/', counts['vehicles/'], 4, 13),
+            })
+        yield object_
+
+
+def generate_pages(endpoint, scale=1, seed=0, page_size=10, base_url=None):
+    """Yields (url, page) pairs in the API's pagination format, with the urls get_pages requests them by"""
+    base_url = base_url or swapi.base_url
+    total = count(endpoint, scale)
+    page_count = math.ceil(total / page_size)
+    first_url = base_url + endpoint
+
+    def next_url(page):
+        return swapi.page_url(f'{first_url}?page={page}', page) if page <= page_count else None
+
+    objects = generate_objects(endpoint, scale, seed, base_url)
+    for page in range(1, page_count + 1):
+        results = [next(objects) for _ in range(min(page_size, total - (page - 1) * page_size))]
+        data = {
+            'count': total,
+            'next': next_url(page + 1),
+            'previous': next_url(page - 1) if page > 1 else None,
+            'results': results,
+        }
+        yield (first_url if page == 1 else next_url(page)), data
+
+
+def write_snapshot(directory, scale=1, seed=0, page_size=10, base_url=None):
+    """Writes every endpoint into a cache directory that insert.py --replay loads from"""
+    cache = ResponseCache(directory)
+    for endpoint in base_counts:
+        for page_url, data in generate_pages(endpoint, scale, seed, page_size, base_url):
+            cache.put(page_url, data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic, SWAPI shaped snapshot for insert.py --replay')
+    parser.add_argument('--scale', type=float, default=10, help='how many times larger than the real API to make every table')
+    parser.add_argument('--seed', type=int, default=0, help='the same seed and scale always generate the same data')
+    parser.add_argument('--page-size', type=int, default=10, help='objects per page, the real API uses 10')
+    parser.add_argument('--output', default='synthetic_snapshot', help='directory to write the snapshot to')
+    args = parser.parse_args()
+
+    write_snapshot(args.output, args.scale, args.seed, args.page_size)
+    print(f"Wrote a {args.scale}x snapshot to {args.output}, load it with: python insert.py --replay {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import os
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import create
+import metrics
+
+
+processes = int(os.getenv('TRANSFORM_PROCESSES', 1))  # Worker processes pages are transformed in, 1 for none
+min_objects = 2000  # Objects an endpoint transforms on the loading thread before sharding its remaining pages
+task_objects = 500  # Objects sent to a worker at a time, so a task's transform outweighs shipping it between processes
+tasks_ahead = 2  # Tasks in flight per worker process, so workers don't wait for the loader to ask for more
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def init_worker(compact):
+    """Runs in each worker, which may have started without the loading process's settings"""
+    create.compact = compact
+
+
+def get_pool():
+    """The shared process pool, started the first time an endpoint is large enough to need it"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # Forking would copy the fetching threads' locks mid-use, so workers start as fresh interpreters
+                _pool = ProcessPoolExecutor(processes, multiprocessing.get_context('spawn'),
+                                            initializer=init_worker, initargs=(create.compact,))
+    return _pool
+
+
+def transform_pages(function, table_name, pages):
+    """A worker's task: several pages at once"""
+    return [function(table_name, page) for page in pages]
+
+
+def map_pages(function, table_name, pages):
+    """Yields function(table_name, page) for every page, in the order of pages.
+    The first min_objects objects are transformed here. With more than one process, the pages after them
+    are sent to the pool in tasks of about task_objects objects, keeping tasks_ahead tasks per process in flight
+    and collecting the oldest first. The time spent transforming, or waiting for the workers to,
+    counts towards the current stage's transform time."""
+    pages = iter(pages)
+    seen = 0
+    for page in pages:
+        with metrics.timed('transform_seconds'):
+            result = function(table_name, page)
+        yield result
+        seen += len(page)
+        if processes > 1 and seen >= min_objects:
+            break
+
+    in_flight = deque()
+    task, task_size = [], 0
+    for page in pages:
+        task.append(page)
+        task_size += len(page)
+        if task_size >= task_objects:
+            in_flight.append(get_pool().submit(transform_pages, function, table_name, task))
+            task, task_size = [], 0
+            if len(in_flight) >= processes * tasks_ahead:
+                yield from collect(in_flight)
+    if task:
+        in_flight.append(get_pool().submit(transform_pages, function, table_name, task))
+    while in_flight:
+        yield from collect(in_flight)
+
+
+def collect(in_flight):
+    """The results of the oldest task"""
+    with metrics.timed('transform_seconds'):
+        return in_flight.popleft().result()
+
+
+def close_pool():
+    """Stops the worker processes"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = None
@@ -0,0 +1,88 @@
+"""
+Course: CSCI 265: Database Systems
+Assignment: Final Project
+Author: Mark Morykan
+"""
+
+import os
+import re
+import tempfile
+import db
+
+
+bulk = False  # Write tables with LOAD DATA LOCAL INFILE instead of executemany
+batch_size = db.batch_size  # Rows held in memory for a table before they are written
+
+
+def column_list(columns):
+    return f" ({', '.join(columns)})" if columns else ''
+
+
+def insert_rows(cursor, table_name, columns, rows):
+    """Write rows with an executemany INSERT"""
+    rows = list(rows)
+    if not rows:
+        return
+    placeholders = ', '.join(['%s'] * len(rows[0]))
+    sql = f"INSERT INTO {table_name}{column_list(columns)} VALUES ({placeholders});"
+    cursor.executemany(sql, rows)
+
+
+def upsert_rows(cursor, table_name, columns, rows):
+    """Write rows with an INSERT that updates every row whose primary key already exists"""
+    rows = list(rows)
+    if not rows:
+        return
+    placeholders = ', '.join(['%s'] * len(columns))
+    updates = ', '.join(f'{column} = VALUES({column})' for column in columns[1:])
+    sql = f"INSERT INTO {table_name}{column_list(columns)} VALUES ({placeholders}) ON DUPLICATE KEY UPDATE {updates};"
+    cursor.executemany(sql, rows)
+
+
+def tsv_field(value):
+    """Formats a value the way LOAD DATA reads it with the default escape character"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        value = int(value)
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r').replace('\0', '\\0')
+
+
+tsv_escapes = {'\\': '\\', 't': '\t', 'n': '\n', 'r': '\r', '0': '\0'}
+
+
+def tsv_values(line):
+    """The values of a line written with tsv_field, as strings with None for NULL"""
+    return [None if field == '\\N' else
+            re.sub(r'\\(.)', lambda match: tsv_escapes.get(match.group(1), match.group(1)), field) if '\\' in field else field
+            for field in line.rstrip('\n').split('\t')]
+
+
+def load_data_file(cursor, table_name, columns, path):
+    """Bulk load a TSV file written with tsv_field"""
+    path = path.replace('\\', '/')
+    cursor.execute(f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {table_name} CHARACTER SET utf8mb4 " +
+                   "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n'" +
+                   f"{column_list(columns)};")
+
+
+def load_data_rows(cursor, table_name, columns, rows):
+    """Write rows by streaming them into a temporary TSV file and bulk loading it"""
+    with tempfile.NamedTemporaryFile('w', suffix='.tsv', encoding='utf-8', newline='', delete=False) as file:
+        row_count = 0
+        for row in rows:
+            file.write('\t'.join(tsv_field(value) for value in row) + '\n')
+            row_count += 1
+    try:
+        if row_count:
+            load_data_file(cursor, table_name, columns, file.name)
+    finally:
+        os.remove(file.name)
+
+
+def write_rows(cursor, table_name, columns, rows):
+    """Write rows into the table with the selected writer, executemany on backends without LOAD DATA"""
+    if bulk and db.backend.load_data:
+        load_data_rows(cursor, table_name, columns, rows)
+    else:
+        insert_rows(cursor, table_name, columns, rows)